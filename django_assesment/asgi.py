@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_assesment.settings')
 
 application = get_asgi_application()
+
+# Pay for URL loading, hashers, JWT keys and the schema now, not on the
+# first requests.
+from users.warmup import warm_up  # noqa: E402
+
+warm_up()
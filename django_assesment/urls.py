@@ -1,15 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularSwaggerView,
-    SpectacularAPIView,
-)
+from users.views import SchemaView, SwaggerView, metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("users.urls")),
     path("auth/", include("social_django.urls", namespace="social")),
-    path("docs/", SpectacularSwaggerView.as_view(url_name="docs")),
-    path("schema/", SpectacularAPIView.as_view(), name="docs"),
+    path("docs/", SwaggerView.as_view(url_name="docs")),
+    path("schema/", SchemaView.as_view(), name="docs"),
+    path("metrics", metrics_view, name="metrics"),
     # Optional UI:
 ]
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_assesment.settings')
 
 application = get_wsgi_application()
+
+# Pay for URL loading, hashers, JWT keys and the schema now, not on the
+# first requests.
+from users.warmup import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,178 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, models
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .cache import BoundedTTLCache
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "FLUSH_INTERVAL": 10.0,
+    "MAX_PENDING": 10000,
+    "BATCH_SIZE": 500,
+    "SEEN_RESOLUTION": 60,
+    "ROLES": ["coach", "agent"],
+}
+
+
+def get_setting(name):
+    return getattr(settings, "ACTIVITY_TRACKING", {}).get(name, DEFAULTS[name])
+
+
+class ActivityTracker:
+    """Buffers `last_login` / `last_seen` touches and writes them in batches.
+
+    Touches are kept in memory, one entry per user however often they are
+    seen, and a background thread writes them every `FLUSH_INTERVAL`
+    seconds (sooner once `MAX_PENDING` users are waiting) as one multi-row
+    UPDATE per `BATCH_SIZE` users; timestamps are kept to the second so
+    the UPDATE has one branch per second rather than per user. Pending
+    touches are written when the process exits. `last_seen` is kept for
+    the `ROLES` only and moves at most once per `SEEN_RESOLUTION` seconds
+    per user, so both columns lag by at most those intervals added
+    together.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # user id -> [last_login, last_seen]
+        self._recent = BoundedTTLCache(
+            get_setting("MAX_PENDING"), get_setting("SEEN_RESOLUTION")
+        )
+        self._wake = threading.Event()
+        self._started = False
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The parent writes what it had buffered.
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._recent.clear()
+        self._wake = threading.Event()
+        self._started = False
+
+    def tracks(self, role):
+        roles = get_setting("ROLES")
+        return roles is None or role in roles
+
+    def record_login(self, user):
+        now = timezone.now().replace(microsecond=0)
+        seen = None
+        if self.tracks(user.role):
+            self._recent.set(user.pk, True)
+            seen = now
+        self._record(user.pk, now, seen)
+
+    def touch(self, user_id, role):
+        """Note an authenticated request by the user."""
+        if not self.tracks(role) or self._recent.get(user_id):
+            return
+        self._recent.set(user_id, True)
+        self._record(user_id, None, timezone.now().replace(microsecond=0))
+
+    def _record(self, user_id, login, seen):
+        self.ensure_started()
+        with self._lock:
+            entry = self._pending.setdefault(user_id, [None, None])
+            if login is not None:
+                entry[0] = login
+            if seen is not None:
+                entry[1] = seen
+            full = len(self._pending) >= get_setting("MAX_PENDING")
+        if full:
+            self._wake.set()
+
+    def ensure_started(self):
+        """Start this process's flusher thread."""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            thread = threading.Thread(
+                target=self._flush_loop, name="activity-flusher", daemon=True
+            )
+            thread.start()
+            atexit.register(self._flush_at_exit)
+            self._started = True
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(get_setting("FLUSH_INTERVAL"))
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write user activity")
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            # The database may be gone by now, like a test run's.
+            logger.warning("Could not write user activity at exit: %s", e)
+
+    def flush(self):
+        """Write the pending touches; returns how many users were updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        entries = iter(pending.items())
+        written = 0
+        while batch := list(islice(entries, get_setting("BATCH_SIZE"))):
+            try:
+                written += self.write(batch)
+            except Exception:
+                # Retried with the next flush, unless newer touches replace them.
+                self._requeue([*batch, *entries])
+                raise
+        return written
+
+    def _requeue(self, entries):
+        with self._lock:
+            for user_id, (login, seen) in entries:
+                entry = self._pending.setdefault(user_id, [None, None])
+                entry[0] = entry[0] or login
+                entry[1] = entry[1] or seen
+
+    def write(self, batch):
+        updates = {}
+        for index, field in enumerate(("last_login", "last_seen")):
+            # Touches are kept to the second, so one When covers every user
+            # seen in the same second.
+            users_by_moment = defaultdict(list)
+            for user_id, values in batch:
+                if values[index] is not None:
+                    users_by_moment[values[index]].append(user_id)
+            if users_by_moment:
+                updates[field] = Case(
+                    *(
+                        When(
+                            Q(pk__in=user_ids) & self.older(field, moment),
+                            then=Value(moment),
+                        )
+                        for moment, user_ids in users_by_moment.items()
+                    ),
+                    default=F(field),
+                    output_field=models.DateTimeField(),
+                )
+        return CustomUser.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            **updates
+        )
+
+    @staticmethod
+    def older(field, moment):
+        # Timestamps only move forward, whichever worker writes last.
+        return Q(**{f"{field}__isnull": True}) | Q(**{f"{field}__lt": moment})
+
+
+activity_tracker = ActivityTracker()
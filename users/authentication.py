@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .activity import activity_tracker
+from .cache import BoundedTTLCache
+from .models import CustomUser
+
+DEFAULTS = {
+    "MAX_SIZE": 10000,
+    "TTL": 60,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "TOKEN_VERSION_CACHE", {}).get(name, DEFAULTS[name])
+
+
+# user id -> (token_version, is_active). Other workers pick up a revocation
+# once their entry expires, so TTL bounds how long a revoked token lives.
+token_versions = BoundedTTLCache(get_setting("MAX_SIZE"), get_setting("TTL"))
+
+
+def get_token_state(user_id):
+    # Read from the primary: a lagging replica would cache a revoked
+    # version for the whole TTL right after forget_token_states().
+    state = token_versions.get(user_id)
+    if state is None:
+        state = (
+            CustomUser.objects.filter(pk=user_id)
+            .values_list("token_version", "is_active")
+            .first()
+        ) or (None, False)
+        token_versions.set(user_id, state)
+    return state
+
+
+def remember_token_state(user):
+    token_versions.set(user.pk, (user.token_version, user.is_active))
+
+
+def forget_token_states(user_ids):
+    """Drop cached states after a bulk UPDATE, which sends no post_save."""
+    for user_id in user_ids:
+        token_versions.delete(user_id)
+
+
+class ClaimsUser(TokenUser):
+    """Stateless user built from the claims added by `get_tokens_for_user`."""
+
+    def __str__(self):
+        return self.email
+
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+    @cached_property
+    def role(self):
+        return self.token.get("role", "")
+
+    @cached_property
+    def token_version(self):
+        return self.token.get("ver")
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims instead of loading the user.
+
+    Only the user's token version is checked, against `token_versions`;
+    tokens issued before the version claim existed fall back to a lookup.
+    The request is recorded as the user's `last_seen`.
+    """
+
+    def get_user(self, validated_token):
+        if "ver" not in validated_token:
+            user = super().get_user(validated_token)
+            activity_tracker.touch(user.pk, user.role)
+            return user
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version, is_active = get_token_state(user_id)
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token["ver"] != version:
+            raise AuthenticationFailed(
+                _("Token has been revoked."), code="token_revoked"
+            )
+        activity_tracker.touch(user_id, validated_token.get("role"))
+        return ClaimsUser(validated_token)
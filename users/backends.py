@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import get_hasher
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.utils.crypto import get_random_string
+
+from . import hashing
+
+UserModel = get_user_model()
+
+# Default hasher's algorithm -> hash of a random password.
+_dummy_hashes = {}
+
+
+def dummy_password_hash():
+    """A hash made with the current default hasher, matching no password.
+
+    Checking a password against it costs as much as checking one against a
+    real user's up-to-date hash.
+    """
+    algorithm = get_hasher("default").algorithm
+    encoded = _dummy_hashes.get(algorithm)
+    if encoded is None:
+        encoded = _dummy_hashes[algorithm] = hashing.make_password(
+            get_random_string(32)
+        )
+    return encoded
+
+
+class EmailPasswordBackend(ModelBackend):
+    """Email/password authentication in one indexed query.
+
+    The user is looked up with `email__lower`, served by the
+    user_email_ci_unique index, so the email matches whatever its case.
+    Passwords are checked on the process pool from `users.hashing`; for an
+    unknown email the password is checked against `dummy_password_hash()`,
+    so the response takes as long as for a wrong password. The login views
+    call it directly instead of going through `authenticate()`, which would
+    try the social backends first.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        email = email or username
+        if email is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(email)
+        except UserModel.DoesNotExist:
+            hashing.verify_password(password, dummy_password_hash())
+        else:
+            is_correct = hashing.check_user_password(user, password)
+            if is_correct and self.user_can_authenticate(user):
+                return user
+
+    async def aauthenticate(
+        self, request, username=None, password=None, email=None, **kwargs
+    ):
+        email = email or username
+        if email is None or password is None:
+            return
+        try:
+            user = await UserModel._default_manager.aget(
+                email__lower=Lower(Value(email))
+            )
+        except UserModel.DoesNotExist:
+            await hashing.averify_password(password, dummy_password_hash())
+        else:
+            is_correct = await hashing.acheck_user_password(user, password)
+            if is_correct and self.user_can_authenticate(user):
+                return user
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+
+from users.activity import activity_tracker
+
+
+@contextmanager
+def scratch_database(on_disk=False):
+    """Run the block against a freshly migrated test database, then drop it.
+
+    SQLite test databases live in memory, where concurrent writers fail with
+    "table is locked"; `on_disk` puts them in a temporary file instead.
+    """
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    directory = None
+    if on_disk and connection.vendor == "sqlite":
+        directory = tempfile.mkdtemp()
+        test_settings["NAME"] = os.path.join(directory, "scratch.sqlite3")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        # Touches recorded in the block belong to the scratch database; left
+        # for the exit flush, they would be written to the real one.
+        try:
+            activity_tracker.flush()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
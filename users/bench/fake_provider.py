@@ -0,0 +1,178 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+CLIENT_ID = "fake-client-id.apps.googleusercontent.com"
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """Answers Google and Facebook userinfo requests with canned profiles.
+
+    The access token doubles as the local part of the returned email, so
+    `player1` resolves to `player1@example.com`. A token of `invalid` gets
+    a 401 like a real provider would send. `/oauth2/v3/certs` publishes the
+    key set that `FakeProviderServer.id_token()` signs with.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.track_in_flight():
+            self.respond(server)
+
+    def respond(self, server):
+        if server.slow_ratio and random.random() < server.slow_ratio:
+            time.sleep(server.slow_delay)
+        elif server.delay:
+            time.sleep(server.delay)
+
+        if server.error_ratio and random.random() < server.error_ratio:
+            return self.send_json(502, {"error": "bad gateway"})
+
+        url = urlparse(self.path)
+        if url.path == "/oauth2/v3/certs":
+            server.jwks_requests += 1
+            return self.send_json(
+                200,
+                server.jwks,
+                {"Cache-Control": f"public, max-age={server.jwks_max_age}"},
+            )
+
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            token = auth[len("Bearer ") :]
+        else:
+            token = parse_qs(url.query).get("access_token", [""])[0]
+
+        if not token or token == "invalid":
+            return self.send_json(401, {"error": "invalid_token"})
+
+        email = f"{token}@example.com"
+        if url.path.startswith("/oauth2/"):
+            return self.send_json(
+                200, {"sub": token, "email": email, "email_verified": True}
+            )
+        return self.send_json(200, {"id": token, "name": token, "email": email})
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        delay=0.0,
+        slow_ratio=0.0,
+        slow_delay=0.0,
+        error_ratio=0.0,
+        jwks_max_age=3600,
+    ):
+        super().__init__(address, FakeProviderHandler)
+        self.delay = delay
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.error_ratio = error_ratio
+        self.jwks_max_age = jwks_max_age
+        self.jwks_requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def track_in_flight(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their read deadline hang up mid-response.
+        pass
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def userinfo_urls(self):
+        return {
+            "google": f"{self.base_url}/oauth2/v3/userinfo",
+            "facebook": f"{self.base_url}/me",
+        }
+
+    @property
+    def jwks_url(self):
+        return f"{self.base_url}/oauth2/v3/certs"
+
+    @cached_property
+    def signing_key(self):
+        # Generated per server, so nothing signed by it verifies elsewhere.
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    @cached_property
+    def jwks(self):
+        key = jwt.algorithms.RSAAlgorithm.to_jwk(
+            self.signing_key.public_key(), as_dict=True
+        )
+        return {"keys": [{**key, "kid": "fake-1", "alg": "RS256", "use": "sig"}]}
+
+    def id_token(self, sub, audience=CLIENT_ID, lifetime=3600, **claims):
+        """A Google-style ID token for `sub`, signed with the served key set."""
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": audience,
+            "sub": sub,
+            "email": f"{sub}@example.com",
+            "email_verified": True,
+            "iat": now,
+            "exp": now + lifetime,
+            **claims,
+        }
+        return jwt.encode(
+            payload, self.signing_key, algorithm="RS256", headers={"kid": "fake-1"}
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,209 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from users.bench.seed import seed_email
+from users.bench.stats import summarize
+from users.models import CustomUser
+from users.tokens import get_tokens_for_user
+
+
+def client_ip(i):
+    # A distinct client address per request, so per-IP throttles behave as
+    # they would for a crowd of users rather than one abusive client.
+    return f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+class Scenario:
+    """One endpoint under load; `request(i)` describes the i-th request."""
+
+    name = None
+    method = "post"
+    path = None
+    expected = (200,)
+
+    def setup(self, context, requests):
+        pass
+
+    def request(self, i):
+        raise NotImplementedError
+
+    def headers(self, i):
+        return {}
+
+    def handle_response(self, response):
+        pass
+
+
+class Signup(Scenario):
+    name = "signup"
+    path = "/api/users/signup/"
+    expected = (201,)
+
+    def request(self, i):
+        return {
+            "email": f"load{i}@loadtest.example.com",
+            "role": "coach",
+            "password": "load-test-password",
+            "password_confirmation": "load-test-password",
+        }
+
+
+class Login(Scenario):
+    name = "login"
+    path = "/api/users/login/"
+
+    def setup(self, context, requests):
+        self.context = context
+
+    def request(self, i):
+        return {
+            "email": seed_email("seed", i % self.context["seeded"]),
+            "password": self.context["password"],
+        }
+
+
+class PasswordReset(Login):
+    name = "password-reset"
+    path = "/api/users/password-reset/"
+
+    def request(self, i):
+        return {"email": seed_email("seed", i % self.context["seeded"])}
+
+
+class SocialLogin(Scenario):
+    name = "social-login"
+    path = "/api/users/social-login/"
+
+    def request(self, i):
+        provider = "google" if i % 2 else "facebook"
+        return {"provider": provider, "access_token": f"social{i}"}
+
+
+class SocialLoginIdToken(Scenario):
+    """Google sign-in with ID tokens; one request in ten is a new user."""
+
+    name = "social-login-id-token"
+    path = "/api/users/social-login/"
+
+    def setup(self, context, requests):
+        users = max(1, requests // 10)
+        # Signed up front, so signing is not part of the measurement.
+        self.tokens = [
+            context["provider"].id_token(f"idtoken{i % users}") for i in range(requests)
+        ]
+
+    def request(self, i):
+        return {"provider": "google", "id_token": self.tokens[i]}
+
+
+class TokenRefresh(Scenario):
+    name = "token-refresh"
+    path = "/api/users/token/refresh/"
+
+    def setup(self, context, requests):
+        user = CustomUser.objects.get(email=seed_email("seed", 0))
+        # Rotation revokes each token on use, so every request needs its own.
+        self.tokens = [get_tokens_for_user(user)["refresh"] for _ in range(requests)]
+
+    def request(self, i):
+        return {"refresh": self.tokens[i]}
+
+
+class AuthenticatedGet(Scenario):
+    method = "get"
+
+    def setup(self, context, requests):
+        self.authorization = f"Bearer {context['admin_tokens']['access']}"
+
+    def request(self, i):
+        return None
+
+    def headers(self, i):
+        return {"HTTP_AUTHORIZATION": self.authorization}
+
+
+class UserList(AuthenticatedGet):
+    """Walks the directory page by page, restarting at the end."""
+
+    name = "user-list"
+    path = "/api/users/"
+
+    def setup(self, context, requests):
+        super().setup(context, requests)
+        self.local = threading.local()
+
+    @property
+    def current_path(self):
+        return getattr(self.local, "next", None) or f"{self.path}?page_size=50"
+
+    def handle_response(self, response):
+        self.local.next = response.json().get("next") if response.ok else None
+
+
+class UserStats(AuthenticatedGet):
+    name = "user-stats"
+    path = "/api/users/stats/"
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Signup,
+        Login,
+        PasswordReset,
+        SocialLogin,
+        SocialLoginIdToken,
+        TokenRefresh,
+        UserList,
+        UserStats,
+    )
+}
+
+
+def run_scenario(scenario, requests, concurrency):
+    """Drive `requests` requests through the WSGI handler in-process.
+
+    Queries are captured per request on the worker thread's connection, so
+    the count is exact even with several threads.
+    """
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        path = getattr(scenario, "current_path", scenario.path)
+        extra = {"REMOTE_ADDR": client_ip(i), **scenario.headers(i)}
+        data = scenario.request(i)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if scenario.method == "get":
+                response = local.client.get(path, **extra)
+            else:
+                response = local.client.post(
+                    path, data, content_type="application/json", **extra
+                )
+            latency = time.perf_counter() - start
+        response.ok = response.status_code < 400
+        scenario.handle_response(response)
+        return latency, response.status_code, len(queries)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for _, status_code, _ in outcomes:
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+    errors = sum(1 for _, code, _ in outcomes if code not in scenario.expected)
+    result = summarize([latency for latency, _, _ in outcomes], elapsed, errors)
+    result["queries_per_request"] = round(
+        sum(count for _, _, count in outcomes) / max(1, len(outcomes)), 2
+    )
+    result["status_codes"] = statuses
+    return result
@@ -0,0 +1,47 @@
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import ROLE_CHOICES, CustomUser
+from users.stats import increment, role_key, signups_key
+
+ROLES = [value for value, _ in ROLE_CHOICES]
+
+
+def seed_email(prefix, i):
+    return f"{prefix}{i}@example.com"
+
+
+def seed_users(count, batch_size=5000, prefix="seed", password="password", start=0):
+    """Insert `count` synthetic users; yields how many were created so far.
+
+    Every user shares one password hash, so seeding costs a single hash
+    no matter how many rows are written. Re-running with the same prefix
+    skips rows that already exist, and the counters only count new rows.
+    """
+    hashed = make_password(password)
+    end = start + count
+    created = 0
+    for offset in range(start, end, batch_size):
+        emails = {
+            seed_email(prefix, i): ROLES[i % len(ROLES)]
+            for i in range(offset, min(offset + batch_size, end))
+        }
+        with transaction.atomic():
+            existing = set(
+                CustomUser.objects.filter(email__in=emails).values_list(
+                    "email", flat=True
+                )
+            )
+            users = CustomUser.objects.bulk_create(
+                CustomUser(email=email, role=role, password=hashed)
+                for email, role in emails.items()
+                if email not in existing
+            )
+            deltas = Counter(role_key(user.role) for user in users)
+            deltas[signups_key(timezone.localdate())] = len(users)
+            increment(deltas)
+        created += len(users)
+        yield created
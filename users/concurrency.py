@@ -0,0 +1,281 @@
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import metrics
+
+DEFAULTS = {
+    "INITIAL_LIMIT": 10,
+    "MIN_LIMIT": 1,
+    "MAX_LIMIT": 100,
+    "MAX_QUEUE": 10,
+    "QUEUE_TIMEOUT": 1.0,
+    "TOLERANCE": 1.5,
+    "SMOOTHING": 0.2,
+    "BASELINE_SAMPLES": 500,
+    "RETRY_AFTER": 1,
+}
+
+
+def get_setting(route, name, overrides=None):
+    """`CONCURRENCY_LIMITS[route][name]`, else the override from urls.py."""
+    configured = getattr(settings, "CONCURRENCY_LIMITS", {}).get(route, {})
+    if name in configured:
+        return configured[name]
+    return (overrides or {}).get(name, DEFAULTS[name])
+
+
+class AsyncWaiter:
+    """A queued coroutine; `set()` may be called from any thread."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+    def set(self):
+        self.granted = True
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def is_set(self):
+        return self.granted
+
+
+class ConcurrencyLimiter:
+    """Caps the requests a route handles at once, adapting the cap to latency.
+
+    Up to `limit` requests run; the next `MAX_QUEUE` wait up to
+    `QUEUE_TIMEOUT` seconds for a slot, first come first served, and the
+    rest are shed at once. A freed slot is handed straight to the oldest
+    waiter.
+
+    The limit follows the latency of successful responses. `baseline` is
+    the latency of an unloaded route: it drops to any faster response and
+    rises by 1/`BASELINE_SAMPLES` of the gap per slower one, so a lasting
+    slowdown (a slower provider, more hash iterations) eventually becomes
+    the new normal. While responses stay within `TOLERANCE` times the
+    baseline the limit grows by sqrt(limit) per sample; beyond that it
+    shrinks in proportion, by at most half, so it settles where requests
+    start to queue for the resource behind the route. Each step is smoothed
+    by `SMOOTHING`, and the limit only grows while at least half of it is
+    in use. Error responses are not sampled, since rejections (validation,
+    throttling, an open circuit breaker) are fast without the route being
+    idle.
+    """
+
+    def __init__(self, route, **overrides):
+        self.route = route
+        self.overrides = {name.upper(): value for name, value in overrides.items()}
+        self._lock = threading.Lock()
+        self.limit = float(self.setting("INITIAL_LIMIT"))
+        self.baseline = None
+        self.in_flight = 0
+        self.waiters = deque()
+        self.shed = {"queue_full": 0, "timeout": 0}
+
+    def setting(self, name):
+        return get_setting(self.route, name, self.overrides)
+
+    def _try_acquire(self, make_waiter):
+        """True with a slot, a waiter to wait on, or None when shed."""
+        with self._lock:
+            if not self.waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            if len(self.waiters) >= self.setting("MAX_QUEUE"):
+                self._shed("queue_full")
+                return None
+            waiter = make_waiter()
+            self.waiters.append(waiter)
+            return waiter
+
+    def _give_up(self, waiter):
+        """Leave the queue; True if the slot was granted in the meantime."""
+        with self._lock:
+            if waiter.is_set():
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    def acquire(self):
+        waiter = self._try_acquire(threading.Event)
+        if waiter is True or waiter is None:
+            return bool(waiter)
+        if waiter.wait(self.setting("QUEUE_TIMEOUT")) or self._give_up(waiter):
+            return True
+        with self._lock:
+            self._shed("timeout")
+        return False
+
+    async def aacquire(self):
+        waiter = self._try_acquire(AsyncWaiter)
+        if waiter is True or waiter is None:
+            return bool(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, self.setting("QUEUE_TIMEOUT"))
+            return True
+        except asyncio.TimeoutError:
+            if self._give_up(waiter):
+                return True
+            with self._lock:
+                self._shed("timeout")
+            return False
+        except asyncio.CancelledError:
+            # The client went away while queued.
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    def release(self, latency=None, in_flight=None):
+        with self._lock:
+            self.in_flight -= 1
+            if latency is not None:
+                self._sample(latency, in_flight)
+            while self.waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                self.waiters.popleft().set()
+
+    def _sample(self, latency, in_flight):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) / self.setting(
+                "BASELINE_SAMPLES"
+            )
+        gradient = self.setting("TOLERANCE") * self.baseline / max(latency, 1e-6)
+        if gradient >= 1.0:
+            if in_flight < self.limit / 2:
+                # Not enough load to tell whether a higher limit would hold.
+                return
+            target = self.limit + math.sqrt(self.limit)
+        else:
+            target = self.limit * max(0.5, gradient)
+        smoothing = self.setting("SMOOTHING")
+        limit = self.limit * (1 - smoothing) + target * smoothing
+        self.limit = max(
+            self.setting("MIN_LIMIT"), min(self.setting("MAX_LIMIT"), limit)
+        )
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        shed_total.inc(self.route, reason)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queued": len(self.waiters),
+                "baseline_seconds": self.baseline,
+                "shed": dict(self.shed),
+            }
+
+    def overloaded(self):
+        return JsonResponse(
+            {"error": "The server is busy, please retry shortly."},
+            status=503,
+            headers={"Retry-After": str(self.setting("RETRY_AFTER"))},
+        )
+
+
+# URL name -> its limiter, for the metrics below.
+limiters = {}
+
+
+def limiter_gauge(key):
+    def read():
+        return {
+            (route,): limiter.stats()[key] for route, limiter in list(limiters.items())
+        }
+
+    return read
+
+
+shed_total = metrics.registry.counter(
+    "users_concurrency_shed_total",
+    "Requests rejected with 503 by a route's concurrency limiter, by reason "
+    "(queue_full, timeout).",
+    ("route", "reason"),
+)
+metrics.registry.gauge(
+    "users_concurrency_in_flight",
+    "Requests a route's concurrency limiter currently lets run.",
+    ("route",),
+    limiter_gauge("in_flight"),
+)
+metrics.registry.gauge(
+    "users_concurrency_queued",
+    "Requests waiting for a slot in a route's concurrency limiter.",
+    ("route",),
+    limiter_gauge("queued"),
+)
+metrics.registry.gauge(
+    "users_concurrency_limit",
+    "Current adaptive concurrency limit of a route.",
+    ("route",),
+    limiter_gauge("limit"),
+)
+
+
+def is_sample(response):
+    return response.status_code < 400
+
+
+def limit_concurrency(route, view, **limits):
+    """Run `view` under the `ConcurrencyLimiter` of URL name `route`.
+
+    `limits` (`initial_limit=8`, `max_queue=4`, ...) are the route's
+    defaults; `settings.CONCURRENCY_LIMITS[route]` overrides them. Works on
+    sync and async views.
+    """
+    limiter = limiters[route] = ConcurrencyLimiter(route, **limits)
+
+    if iscoroutinefunction(view):
+
+        async def wrapper(request, *args, **kwargs):
+            if not await limiter.aacquire():
+                return limiter.overloaded()
+            in_flight = limiter.in_flight
+            start = time.perf_counter()
+            response = None
+            try:
+                response = await view(request, *args, **kwargs)
+                return response
+            finally:
+                sampled = response is not None and is_sample(response)
+                limiter.release(
+                    time.perf_counter() - start if sampled else None, in_flight
+                )
+
+        markcoroutinefunction(wrapper)
+    else:
+
+        def wrapper(request, *args, **kwargs):
+            if not limiter.acquire():
+                return limiter.overloaded()
+            in_flight = limiter.in_flight
+            start = time.perf_counter()
+            response = None
+            try:
+                response = view(request, *args, **kwargs)
+                return response
+            finally:
+                sampled = response is not None and is_sample(response)
+                limiter.release(
+                    time.perf_counter() - start if sampled else None, in_flight
+                )
+
+    wrapper = functools.wraps(view)(wrapper)
+    wrapper.limiter = limiter
+    return wrapper
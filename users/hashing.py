@@ -0,0 +1,187 @@
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .metrics import timed
+
+DEFAULTS = {
+    "USE_POOL": True,
+    "WORKERS": None,
+    "MAX_PENDING": None,
+}
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+
+
+def get_setting(name):
+    return getattr(settings, "PASSWORD_HASHING", {}).get(name, DEFAULTS[name])
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def get_pool():
+    """Return this process's hashing pool and its in-flight semaphore.
+
+    The pool is created lazily and re-created after a fork, so each
+    gunicorn worker owns its own pool.
+    """
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = get_setting("WORKERS") or os.cpu_count()
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(
+                get_setting("MAX_PENDING") or workers * 4
+            )
+        return _pool, _slots
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+atexit.register(shutdown)
+
+
+def discard_pool(pool):
+    """Drop a pool whose worker died, so the next call creates a new one."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(pool, slots, fn, *args):
+    """Submit on a slot already taken from `slots`; it is freed when done."""
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _run_once(fn, *args):
+    pool, slots = get_pool()
+    # Block the caller rather than queueing without limit when saturated.
+    slots.acquire()
+    try:
+        return _submit(pool, slots, fn, *args).result()
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+
+
+@timed("password_hashing")
+def run(fn, *args):
+    if not get_setting("USE_POOL"):
+        return fn(*args)
+    try:
+        return _run_once(fn, *args)
+    except BrokenProcessPool:
+        # Hashing has no side effects, so retry once on a fresh pool.
+        return _run_once(fn, *args)
+
+
+async def _arun_once(fn, *args):
+    pool, slots = get_pool()
+    if not slots.acquire(blocking=False):
+        await asyncio.to_thread(slots.acquire)
+    try:
+        return await asyncio.wrap_future(_submit(pool, slots, fn, *args))
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+
+
+async def arun(fn, *args):
+    with timed("password_hashing"):
+        if not get_setting("USE_POOL"):
+            return await sync_to_async(fn, thread_sensitive=False)(*args)
+        try:
+            return await _arun_once(fn, *args)
+        except BrokenProcessPool:
+            return await _arun_once(fn, *args)
+
+
+def make_password(password):
+    return run(hashers.make_password, password)
+
+
+def _make_passwords_once(passwords):
+    pool, slots = get_pool()
+    futures = []
+    try:
+        for password in passwords:
+            slots.acquire()
+            futures.append(_submit(pool, slots, hashers.make_password, password))
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        discard_pool(pool)
+        raise
+
+
+@timed("password_hashing")
+def make_passwords(passwords):
+    """Hash several passwords, in parallel when the pool is enabled."""
+    if not get_setting("USE_POOL"):
+        return [hashers.make_password(password) for password in passwords]
+    try:
+        return _make_passwords_once(passwords)
+    except BrokenProcessPool:
+        return _make_passwords_once(passwords)
+
+
+async def amake_password(password):
+    return await arun(hashers.make_password, password)
+
+
+def verify_password(password, encoded):
+    """Return `(is_correct, must_update)`, see django's verify_password()."""
+    return run(hashers.verify_password, password, encoded)
+
+
+async def averify_password(password, encoded):
+    return await arun(hashers.verify_password, password, encoded)
+
+
+def check_user_password(user, raw_password):
+    """Like `user.check_password()`, but hashing on the pool.
+
+    A correct password stored with an outdated hasher or iteration count is
+    re-hashed with the current one and saved.
+    """
+    is_correct, must_update = verify_password(raw_password, user.password)
+    if is_correct and must_update:
+        user.password = make_password(raw_password)
+        user.save(update_fields=["password"])
+    return is_correct
+
+
+async def acheck_user_password(user, raw_password):
+    is_correct, must_update = await averify_password(raw_password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=["password"])
+    return is_correct
@@ -0,0 +1,208 @@
+import asyncio
+import functools
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+from rest_framework_simplejwt.settings import api_settings
+
+DEFAULTS = {
+    "CACHE": "default",
+    "TTL": 24 * 3600,
+    "LOCK_TIMEOUT": 60,
+    "WAIT_TIMEOUT": 30,
+    "POLL_INTERVAL": 0.05,
+}
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# Hop-by-hop or per-response headers that must not be replayed.
+SKIPPED_HEADERS = {"connection", "set-cookie", "transfer-encoding"}
+
+
+def get_setting(name):
+    return getattr(settings, "IDEMPOTENCY", {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting("CACHE")]
+
+
+class IdempotentRequest:
+    """One request carrying an `Idempotency-Key`, and its cache entries.
+
+    The first request with a key takes a lock entry (`cache.add`), runs the
+    view and stores the response for `ttl` seconds. Duplicates arriving
+    meanwhile poll for the stored response instead of running the view,
+    for up to `WAIT_TIMEOUT` seconds; if the first request ended without
+    storing one (a 5xx or a 429, which are not replayed), the next waiter
+    takes the lock and runs it. Keys are scoped to the method and path,
+    and reusing a key with a different body is rejected. The `a*` methods
+    are the same operations for async views.
+    """
+
+    def __init__(self, request, key, ttl):
+        scope = hashlib.sha256(f"{request.method} {request.path} {key}".encode())
+        self.cache_key = f"idempotency:{scope.hexdigest()}"
+        self.lock_key = f"{self.cache_key}:lock"
+        self.fingerprint = hashlib.sha256(request.body).hexdigest()
+        self.ttl = ttl
+
+    def acquire(self):
+        return get_cache().add(
+            self.lock_key, self.fingerprint, timeout=get_setting("LOCK_TIMEOUT")
+        )
+
+    async def aacquire(self):
+        return await get_cache().aadd(
+            self.lock_key, self.fingerprint, timeout=get_setting("LOCK_TIMEOUT")
+        )
+
+    def release(self):
+        get_cache().delete(self.lock_key)
+
+    async def arelease(self):
+        await get_cache().adelete(self.lock_key)
+
+    def lookup(self):
+        """The stored response to replay, a 422 for another body, or None."""
+        return self.replay(get_cache().get(self.cache_key))
+
+    async def alookup(self):
+        return self.replay(await get_cache().aget(self.cache_key))
+
+    def store(self, response):
+        record = self.record(response)
+        if record is not None:
+            get_cache().set(self.cache_key, record, timeout=self.ttl)
+
+    async def astore(self, response):
+        record = self.record(response)
+        if record is not None:
+            await get_cache().aset(self.cache_key, record, timeout=self.ttl)
+
+    def replay(self, record):
+        if record is None:
+            return None
+        if record["fingerprint"] != self.fingerprint:
+            return mismatch()
+        response = HttpResponse(record["content"], status=record["status"])
+        for name, value in record["headers"]:
+            response[name] = value
+        response["Idempotent-Replayed"] = "true"
+        return response
+
+    def record(self, response):
+        """What to store for `response`, or None if it must not be replayed."""
+        if response.status_code >= 500 or response.status_code == 429:
+            return None
+        if getattr(response, "streaming", False):
+            return None
+        if hasattr(response, "render") and not response.is_rendered:
+            response.render()
+        return {
+            "fingerprint": self.fingerprint,
+            "status": response.status_code,
+            "headers": [
+                (name, value)
+                for name, value in response.items()
+                if name.lower() not in SKIPPED_HEADERS
+            ],
+            "content": response.content,
+        }
+
+
+def get_ttl(carries_tokens):
+    """`TTL`, or at most the access token lifetime for responses with JWTs."""
+    ttl = get_setting("TTL")
+    if carries_tokens:
+        lifetime = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        ttl = min(ttl, int(lifetime))
+    return ttl
+
+
+def mismatch():
+    return JsonResponse(
+        {"error": f"{HEADER} was already used with a different request."},
+        status=422,
+    )
+
+
+def in_progress():
+    return JsonResponse(
+        {"error": f"A request with this {HEADER} is still in progress."},
+        status=409,
+        headers={"Retry-After": "1"},
+    )
+
+
+def invalid_key():
+    return JsonResponse(
+        {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+        status=400,
+    )
+
+
+def idempotent(view, carries_tokens=False):
+    """Run `view` at most once per `Idempotency-Key`, replaying its response.
+
+    Requests without the header are passed through. Set `carries_tokens`
+    for views answering with a token pair, so a replayed response is never
+    older than its access token. Works on sync and async views.
+    """
+
+    if iscoroutinefunction(view):
+
+        async def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return invalid_key()
+            entry = IdempotentRequest(request, key, get_ttl(carries_tokens))
+            deadline = time.monotonic() + get_setting("WAIT_TIMEOUT")
+            while True:
+                response = await entry.alookup()
+                if response is not None:
+                    return response
+                if await entry.aacquire():
+                    try:
+                        response = await view(request, *args, **kwargs)
+                        await entry.astore(response)
+                    finally:
+                        await entry.arelease()
+                    return response
+                if time.monotonic() >= deadline:
+                    return in_progress()
+                await asyncio.sleep(get_setting("POLL_INTERVAL"))
+
+        markcoroutinefunction(wrapper)
+    else:
+
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return invalid_key()
+            entry = IdempotentRequest(request, key, get_ttl(carries_tokens))
+            deadline = time.monotonic() + get_setting("WAIT_TIMEOUT")
+            while True:
+                response = entry.lookup()
+                if response is not None:
+                    return response
+                if entry.acquire():
+                    try:
+                        response = view(request, *args, **kwargs)
+                        entry.store(response)
+                    finally:
+                        entry.release()
+                    return response
+                if time.monotonic() >= deadline:
+                    return in_progress()
+                time.sleep(get_setting("POLL_INTERVAL"))
+
+    return functools.wraps(view)(wrapper)
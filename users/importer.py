@@ -0,0 +1,133 @@
+import csv
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from . import hashing
+from .models import ROLE_CHOICES, CustomUser
+from .stats import increment, role_key, signups_key
+
+DEFAULTS = {
+    "BATCH_SIZE": 1000,
+}
+
+ROLES = {value for value, _ in ROLE_CHOICES}
+
+
+def get_setting(name):
+    return getattr(settings, "USER_IMPORT", {}).get(name, DEFAULTS[name])
+
+
+def iter_rows(lines, fmt):
+    """Yield `(line_number, row)` from an iterable of text lines."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def clean_row(row):
+    """Return `(email, role, password)` or raise ValidationError."""
+    if row is None:
+        raise ValidationError("Malformed row.")
+    # Bytes that were not UTF-8, replaced when the upload was decoded.
+    if any(isinstance(value, str) and "\ufffd" in value for value in row.values()):
+        raise ValidationError("Row is not valid UTF-8.")
+    email = (row.get("email") or "").strip()
+    if not email:
+        raise ValidationError("Email is required.")
+    validate_email(email)
+    role = (row.get("role") or "").strip()
+    if role not in ROLES:
+        raise ValidationError(f"Invalid role {role!r}.")
+    return CustomUser.objects.normalize_email(email), role, row.get("password") or None
+
+
+class UserImporter:
+    """Stream rows into `CustomUser` in `bulk_create` batches.
+
+    Only one batch is held in memory at a time; passwords of a batch are
+    hashed in parallel on the shared pool of `users.hashing`. Every rejected row is passed to
+    `on_error(line_number, email, message)` as soon as it is found.
+    """
+
+    def __init__(self, batch_size=None, on_error=None):
+        self.batch_size = batch_size or get_setting("BATCH_SIZE")
+        self.on_error = on_error or (lambda line_number, email, message: None)
+        self.created = 0
+        self.errors = 0
+
+    def error(self, line_number, email, message):
+        self.errors += 1
+        self.on_error(line_number, email, message)
+
+    def run(self, lines, fmt):
+        rows = iter_rows(lines, fmt)
+        while batch := list(islice(rows, self.batch_size)):
+            self.import_batch(batch)
+        return {"created": self.created, "errors": self.errors}
+
+    def import_batch(self, batch):
+        valid = {}
+        for line_number, row in batch:
+            try:
+                email, role, password = clean_row(row)
+            except ValidationError as e:
+                self.error(line_number, (row or {}).get("email"), e.messages[0])
+                continue
+            # Emails are unique regardless of case.
+            if email.lower() in valid:
+                self.error(line_number, email, "Duplicate email in input.")
+                continue
+            valid[email.lower()] = (line_number, email, role, password)
+
+        existing = CustomUser.objects.filter(email__lower__in=valid).values_list(
+            "email", flat=True
+        )
+        for email in existing:
+            line_number, email, _, _ = valid.pop(email.lower())
+            self.error(line_number, email, "Email already registered.")
+        if not valid:
+            return
+
+        hashes = hashing.make_passwords(
+            [password for _, _, _, password in valid.values()]
+        )
+        users = [
+            CustomUser(email=email, role=role, password=hashed)
+            for (_, email, role, _), hashed in zip(valid.values(), hashes)
+        ]
+        # A concurrent signup can still take an email; its row is skipped by
+        # bulk_create and told apart from ours by the salted password hash.
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users, ignore_conflicts=True)
+            inserted = set(
+                CustomUser.objects.filter(email__lower__in=valid).values_list(
+                    "password", flat=True
+                )
+            )
+            created = [user for user in users if user.password in inserted]
+            deltas = Counter(role_key(user.role) for user in created)
+            deltas[signups_key(timezone.localdate())] = len(created)
+            increment(deltas)
+        self.created += len(created)
+        for (line_number, email, _, _), user in zip(valid.values(), users):
+            if user.password not in inserted:
+                self.error(line_number, email, "Email already registered.")
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import jwt
+from django.conf import settings
+
+from .metrics import timed
+from .providers import ProviderUnavailable
+from .providers import get_setting as get_client_setting
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "JWKS_URL": "https://www.googleapis.com/oauth2/v3/certs",
+    "AUDIENCES": None,
+    "ISSUERS": ["accounts.google.com", "https://accounts.google.com"],
+    "CACHE_DIRECTORY": None,
+    "DEFAULT_MAX_AGE": 3600,
+    "MIN_REFRESH_INTERVAL": 30,
+    "LEEWAY": 30,
+}
+
+# Share of a key set's lifetime after which it is refreshed in the background.
+REFRESH_AHEAD = 0.8
+
+_lock = threading.Lock()
+_caches = {}
+
+
+def get_setting(name):
+    return getattr(settings, "GOOGLE_ID_TOKEN", {}).get(name, DEFAULTS[name])
+
+
+def max_age(headers):
+    """Seconds a response may be cached per Cache-Control and Age, or None."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match is None:
+        return None
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return max(0, int(match.group(1)) - age)
+
+
+class JWKSCache:
+    """The signing keys published at a JWKS URL.
+
+    Keys are cached for as long as the endpoint's Cache-Control allows and
+    saved to `path`, so a restarted worker verifies tokens without fetching
+    them again. After `REFRESH_AHEAD` of that lifetime a background thread
+    fetches them anew while the cached ones keep serving, and if the
+    endpoint is down they stay in use. Requests only wait on the endpoint
+    when nothing is cached yet, or for a token signed with a key we do not
+    know (the provider rotated keys), at most once per
+    `MIN_REFRESH_INTERVAL` seconds.
+    """
+
+    def __init__(self, url, path=None, clock=time.time):
+        self.url = url
+        self.path = path
+        self.clock = clock
+        self.keys = None
+        self.refresh_at = 0.0
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_key(self, kid):
+        """The `PyJWK` with id `kid`, or None if the provider has no such key."""
+        if self.keys is None:
+            with self._lock:
+                if self.keys is None and not self.load():
+                    self.refresh()
+        if self.clock() >= self.refresh_at:
+            self.refresh_in_background()
+        key = self.keys.get(kid)
+        if key is None and self.clock() - self.fetched_at >= get_setting(
+            "MIN_REFRESH_INTERVAL"
+        ):
+            with self._lock:
+                if kid not in self.keys:
+                    self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def refresh(self):
+        """Fetch the key set; on failure keep the cached keys, if any."""
+        try:
+            self.fetch()
+        except ProviderUnavailable:
+            if self.keys is None:
+                raise
+            logger.warning("Could not refresh the JWKS from %s", self.url)
+            self.refresh_at = self.clock() + get_setting("MIN_REFRESH_INTERVAL")
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            # Other requests do not start another refresh meanwhile.
+            self.refresh_at = self.clock() + get_setting("MIN_REFRESH_INTERVAL")
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("JWKS refresh from %s failed", self.url)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+    def fetch(self):
+        import requests
+
+        try:
+            with timed("provider_http"):
+                response = requests.get(
+                    self.url,
+                    timeout=(
+                        get_client_setting("CONNECT_TIMEOUT"),
+                        get_client_setting("READ_TIMEOUT"),
+                    ),
+                )
+            response.raise_for_status()
+            data = response.json()
+            self.set_keys(data)
+        except (requests.RequestException, ValueError, jwt.PyJWKSetError) as e:
+            raise ProviderUnavailable(f"Could not fetch signing keys: {e}") from e
+
+        lifetime = max_age(response.headers)
+        if lifetime is None:
+            lifetime = get_setting("DEFAULT_MAX_AGE")
+        expires_at = self.fetched_at + lifetime
+        self.refresh_at = self.fetched_at + max(
+            lifetime * REFRESH_AHEAD, get_setting("MIN_REFRESH_INTERVAL")
+        )
+        self.save(data, expires_at)
+
+    def set_keys(self, data):
+        key_set = jwt.PyJWKSet.from_dict(data)
+        self.keys = {key.key_id: key for key in key_set.keys}
+        self.fetched_at = self.clock()
+
+    def load(self):
+        """Use the keys saved by an earlier process; False if there are none."""
+        if self.path is None:
+            return False
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved.get("url") != self.url:
+                return False
+            self.set_keys(saved["jwks"])
+        except (OSError, ValueError, KeyError, jwt.PyJWKSetError):
+            return False
+        self.fetched_at = saved.get("fetched_at", 0.0)
+        self.refresh_at = self.fetched_at + REFRESH_AHEAD * (
+            saved.get("expires_at", 0.0) - self.fetched_at
+        )
+        return True
+
+    def save(self, data, expires_at):
+        if self.path is None:
+            return
+        record = {
+            "url": self.url,
+            "jwks": data,
+            "fetched_at": self.fetched_at,
+            "expires_at": expires_at,
+        }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            # A read-only deployment still caches in memory.
+            pass
+
+
+def directory():
+    return get_setting("CACHE_DIRECTORY") or os.path.join(settings.BASE_DIR, ".jwks")
+
+
+def get_jwks(url):
+    """This process's cache of the key set at `url`."""
+    name = hashlib.sha256(url.encode()).hexdigest()[:16]
+    path = os.path.join(directory(), f"{name}.json")
+    cache = _caches.get(path)
+    if cache is None:
+        with _lock:
+            cache = _caches.setdefault(path, JWKSCache(url, path))
+    return cache
+
+
+def verify_google_id_token(id_token):
+    """Claims of a valid Google ID token with a verified email, else None.
+
+    The signature is checked against Google's cached signing keys, so no
+    request goes out to Google in the common case.
+    """
+    try:
+        kid = jwt.get_unverified_header(id_token).get("kid")
+    except jwt.InvalidTokenError:
+        return None
+    key = get_jwks(get_setting("JWKS_URL")).get_key(kid)
+    if key is None:
+        return None
+    try:
+        claims = jwt.decode(
+            id_token,
+            key.key,
+            algorithms=["RS256"],
+            audience=get_setting("AUDIENCES")
+            or [settings.SOCIAL_AUTH_GOOGLE_OAUTH2_KEY],
+            issuer=list(get_setting("ISSUERS")),
+            leeway=get_setting("LEEWAY"),
+            options={"require": ["exp", "iat", "sub"]},
+        )
+    except jwt.InvalidTokenError:
+        return None
+    if not claims.get("email_verified"):
+        return None
+    return claims
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.bench.fake_provider import FakeProviderServer
+from users.bench.stats import summarize
+
+
+def process_status(pid):
+    """Threads and resident memory (MiB) of `pid`, from /proc on Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) / 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the API with one uvicorn worker, once with the DRF views and "
+        "once with the native async views, and measure how many social logins "
+        "against a slow provider each keeps in flight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=500)
+        parser.add_argument("--provider-delay", type=float, default=0.25)
+        parser.add_argument(
+            "--mode", action="append", choices=["sync", "async"], default=None
+        )
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        modes = options["mode"] or ["sync", "async"]
+        server = FakeProviderServer(delay=options["provider_delay"])
+        with server, tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'db.sqlite3')}",
+                "ALLOWED_HOSTS": "127.0.0.1",
+                "SOCIAL_PROVIDER_USERINFO_URLS": json.dumps(server.userinfo_urls),
+                "SCHEMA_CACHE_DIR": os.path.join(directory, "schema"),
+            }
+            for command in (["migrate", "-v", "0"], ["build_schema"]):
+                subprocess.run(
+                    [sys.executable, "manage.py", *command],
+                    env=env,
+                    cwd=settings.BASE_DIR,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True,
+                )
+            results = {
+                mode: self.serve_and_run(
+                    {**env, "ASYNC_AUTH_VIEWS": "1" if mode == "async" else "0"},
+                    server,
+                    options,
+                )
+                for mode in modes
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>6}: {result['rps']:>8} req/s  p50 {result['p50_ms']} ms  "
+                f"p99 {result['p99_ms']} ms  in flight {result['in_flight']} "
+                f"(peak {result['peak_in_flight']})  threads {result['threads']}  "
+                f"rss {result['rss_mib']} MiB  errors {result['errors']}"
+            )
+
+    def serve_and_run(self, env, server, options):
+        port = free_port()
+        worker = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "django_assesment.asgi:application",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+                "--backlog",
+                str(max(2048, options["concurrency"])),
+            ],
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            self.wait_until_up(base_url, worker)
+            return asyncio.run(self.run(base_url, worker.pid, server, options))
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    def wait_until_up(self, base_url, worker, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if worker.poll() is not None:
+                raise CommandError("uvicorn exited before serving requests.")
+            try:
+                httpx.get(f"{base_url}/metrics", timeout=1.0)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        raise CommandError("uvicorn did not start in time.")
+
+    async def run(self, base_url, pid, server, options):
+        latencies = []
+        errors = 0
+        peaks = {"threads": 0, "rss_mib": 0.0}
+        status_codes = Counter()
+        counter = iter(range(options["requests"]))
+        limits = httpx.Limits(
+            max_connections=options["concurrency"],
+            max_keepalive_connections=options["concurrency"],
+        )
+
+        async def login(client, i):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/api/users/social-login/",
+                    json={"provider": "google", "access_token": f"player{i}"},
+                )
+                status_codes[response.status_code] += 1
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                status_codes["error"] += 1
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+        async def user(client):
+            for i in counter:
+                await login(client, i)
+
+        async def sample():
+            while True:
+                status = process_status(pid)
+                if status:
+                    peaks["threads"] = max(peaks["threads"], status[0])
+                    peaks["rss_mib"] = max(peaks["rss_mib"], status[1])
+                await asyncio.sleep(0.1)
+
+        async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=60.0
+        ) as client:
+            # Create the users first, so the measured logins are the
+            # returning-user path.
+            await asyncio.gather(*(user(client) for _ in range(options["concurrency"])))
+            latencies.clear()
+            status_codes.clear()
+            errors = 0
+            counter = iter(range(options["requests"]))
+            server.peak_in_flight = 0
+            sampler = asyncio.create_task(sample())
+            start = time.perf_counter()
+            await asyncio.gather(*(user(client) for _ in range(options["concurrency"])))
+            elapsed = time.perf_counter() - start
+            sampler.cancel()
+
+        result = summarize(latencies, elapsed, errors)
+        # Little's law: requests in flight = throughput x mean latency.
+        result["in_flight"] = round(result["rps"] * statistics.fmean(latencies), 1)
+        # Provider calls open at once, i.e. logins actually parked in the
+        # worker rather than queued in front of it.
+        result["peak_in_flight"] = server.peak_in_flight
+        result["threads"] = peaks["threads"]
+        result["rss_mib"] = round(peaks["rss_mib"], 1)
+        result["status_codes"] = {str(k): v for k, v in status_codes.items()}
+        return result
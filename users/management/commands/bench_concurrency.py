@@ -0,0 +1,109 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from users.concurrency import limit_concurrency
+
+
+class Command(BaseCommand):
+    help = (
+        "Overload a slow route (work limited to --capacity requests at once, "
+        "like the hashing pool) next to a cheap one on a shared pool of "
+        "worker threads, with and without the route's concurrency limiter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--capacity", type=int, default=2)
+        parser.add_argument("--service-ms", type=float, default=100.0)
+        parser.add_argument("--rate", type=float, default=40.0)
+        parser.add_argument("--cheap-rate", type=float, default=20.0)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        capacity = threading.BoundedSemaphore(options["capacity"])
+        service = options["service_ms"] / 1000
+
+        def slow_view(request):
+            with capacity:
+                time.sleep(service)
+            return HttpResponse(status=200)
+
+        def cheap_view(request):
+            return HttpResponse(status=200)
+
+        limited = limit_concurrency("bench", slow_view, initial_limit=10)
+        results = {
+            "unlimited": self.run(slow_view, cheap_view, options),
+            "limited": self.run(limited, cheap_view, options),
+        }
+        results["limited"]["final_limit"] = limited.limiter.stats()["limit"]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            slow, cheap = result["slow"], result["cheap"]
+            self.stdout.write(
+                f"{name:>9}: slow {slow['ok']} ok / {slow['shed']} shed "
+                f"(shed p99 {slow['shed_p99_ms']}ms), "
+                f"p50 {slow['p50_ms']}ms p99 {slow['p99_ms']}ms; "
+                f"cheap p50 {cheap['p50_ms']}ms p99 {cheap['p99_ms']}ms"
+            )
+        self.stdout.write(f"final limit: {results['limited']['final_limit']}")
+
+    def run(self, slow_view, cheap_view, options):
+        request = RequestFactory().post("/")
+        latencies = {"slow": [], "cheap": []}
+        shed = []
+
+        def call(kind, view, submitted):
+            response = view(request)
+            elapsed = time.perf_counter() - submitted
+            if response.status_code == 503:
+                shed.append(elapsed)
+            else:
+                latencies[kind].append(elapsed)
+
+        # Open-loop arrivals: requests keep coming whether or not earlier
+        # ones were answered, as they do from many clients.
+        arrivals = sorted(
+            [
+                (i / options["rate"], "slow", slow_view)
+                for i in range(int(options["rate"] * options["duration"]))
+            ]
+            + [
+                (i / options["cheap_rate"], "cheap", cheap_view)
+                for i in range(int(options["cheap_rate"] * options["duration"]))
+            ],
+            key=lambda arrival: arrival[0],
+        )
+        with ThreadPoolExecutor(options["threads"]) as executor:
+            start = time.perf_counter()
+            for offset, kind, view in arrivals:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(call, kind, view, time.perf_counter())
+
+        slow = self.summary(latencies["slow"])
+        slow["shed"] = len(shed)
+        slow["shed_p99_ms"] = self.summary(shed)["p99_ms"]
+        return {"slow": slow, "cheap": self.summary(latencies["cheap"])}
+
+    def summary(self, latencies):
+        if len(latencies) < 2:
+            return {"ok": len(latencies), "p50_ms": None, "p99_ms": None}
+        cuts = statistics.quantiles(latencies, n=100)
+        return {
+            "ok": len(latencies),
+            "p50_ms": round(cuts[49] * 1000, 1),
+            "p99_ms": round(cuts[98] * 1000, 1),
+        }
@@ -0,0 +1,76 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users import hashing
+from users.bench.stats import summarize
+from users.models import CustomUser
+from users.serializers import UserLoginSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Report logins/sec (total and per core) through UserLoginSerializer "
+        "with password hashing inline and on the process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        email, password = "bench-login@example.com", "bench-password"
+        CustomUser.objects.filter(email=email).delete()
+        CustomUser.objects.create_user(email=email, role="coach", password=password)
+
+        cores = os.cpu_count()
+        results = {"cores": cores}
+        try:
+            for name, use_pool in (("inline", False), ("pool", True)):
+                with override_settings(
+                    PASSWORD_HASHING={
+                        "USE_POOL": use_pool,
+                        "WORKERS": options["workers"],
+                    }
+                ):
+                    result = self.run(email, password, options)
+                    hashing.shutdown()
+                result["logins_per_core"] = round(result["rps"] / cores, 1)
+                results[name] = result
+        finally:
+            CustomUser.objects.filter(email=email).delete()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name in ("inline", "pool"):
+            result = results[name]
+            self.stdout.write(
+                f"{name:>6}: {result['rps']} logins/s, "
+                f"{result['logins_per_core']} per core, p99 {result['p99_ms']} ms"
+            )
+
+    def run(self, email, password, options):
+        def login(_):
+            start = time.perf_counter()
+            serializer = UserLoginSerializer(
+                data={"email": email, "password": password}
+            )
+            ok = serializer.is_valid()
+            return time.perf_counter() - start, not ok
+
+        # Warm up the pool so its start-up is not part of the measurement.
+        login(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as threads:
+            outcomes = list(threads.map(login, range(options["logins"])))
+        elapsed = time.perf_counter() - start
+
+        errors = sum(1 for _, failed in outcomes if failed)
+        return summarize([latency for latency, _ in outcomes], elapsed, errors)
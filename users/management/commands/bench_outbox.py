@@ -0,0 +1,104 @@
+import json
+import time
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from users.models import CustomUser
+from users.outbox import drain
+from users.views import PasswordResetRequestView
+
+
+class SlowEmailBackend(EmailBackend):
+    """locmem backend that pays a fake SMTP handshake and per-message latency."""
+
+    handshake = 0.0
+    per_message = 0.0
+
+    def open(self):
+        time.sleep(self.handshake)
+        return True
+
+    def send_messages(self, messages):
+        time.sleep(self.per_message * len(messages))
+        return super().send_messages(messages)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure password-reset request latency and outbox drain throughput "
+        "with the locmem email backend. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--smtp-handshake", type=float, default=0.05)
+        parser.add_argument("--smtp-latency", type=float, default=0.005)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        SlowEmailBackend.handshake = options["smtp_handshake"]
+        SlowEmailBackend.per_message = options["smtp_latency"]
+        mail.outbox = []
+
+        with transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"request: {results['request_rps']} req/s, "
+            f"{results['queries_per_request']} queries per request\n"
+            f"  drain: {results['drain_mps']} msg/s over "
+            f"{results['connections']} connections "
+            f"(one connection per message would take "
+            f"{results['unbatched_estimate_s']} s instead of {results['drain_s']} s)"
+        )
+
+    def run(self, options):
+        n = options["requests"]
+        email = "bench-outbox@example.com"
+        CustomUser.objects.create_user(email=email, role="coach", password=None)
+
+        factory = APIRequestFactory()
+        view = PasswordResetRequestView.as_view()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(n):
+                response = view(
+                    factory.post(
+                        "/api/users/password-reset/", {"email": email}, format="json"
+                    )
+                )
+                assert response.status_code == 200, response.data
+            request_s = time.perf_counter() - start
+
+        connections = 0
+        start = time.perf_counter()
+        while True:
+            backend = SlowEmailBackend()
+            sent, failed = drain(options["batch_size"], connection=backend)
+            if not sent + failed:
+                break
+            connections += 1
+        drain_s = time.perf_counter() - start
+
+        assert len(mail.outbox) == n
+        return {
+            "requests": n,
+            "request_rps": round(n / request_s, 1),
+            "queries_per_request": round(len(queries) / n, 2),
+            "drain_s": round(drain_s, 3),
+            "drain_mps": round(n / drain_s, 1),
+            "connections": connections,
+            "unbatched_estimate_s": round(
+                n * (options["smtp_handshake"] + options["smtp_latency"]), 3
+            ),
+        }
@@ -0,0 +1,100 @@
+import copy
+import json
+import time
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.permissions import DjangoModelPermissions
+from rest_framework.request import Request
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import ClaimsUser
+from users.bench.database import scratch_database
+from users.models import CustomUser
+from users.permissions import RoleModelPermissions, RolePermission, role_permissions
+
+
+class BenchView(APIView):
+    queryset = CustomUser.objects.all()
+    required_permissions = ["users.view_customuser", "users.change_customuser"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of one permission check per request: Django's "
+        "has_perms() on the user against the role bitmap, on a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=5000)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = self.setup()
+            token = AccessToken()
+            token["user_id"] = user.pk
+            token["role"] = user.role
+            claims_user = ClaimsUser(token)
+            results = {
+                # A user loaded per request starts with an empty permission cache.
+                "model_permissions_has_perms": self.measure(
+                    DjangoModelPermissions(), lambda: copy.copy(user), options
+                ),
+                "role_model_permissions": self.measure(
+                    RoleModelPermissions(), lambda: claims_user, options
+                ),
+                "role_permission": self.measure(
+                    RolePermission(), lambda: claims_user, options
+                ),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>27}: {result['us_per_check']}us/check, "
+                f"{result['queries_per_check']} queries/check"
+            )
+
+    def setup(self):
+        permissions = Permission.objects.filter(content_type__app_label="users")
+        for role in ("admin", "coach", "agent", "football_player"):
+            group = Group.objects.create(name=role)
+            if role in ("admin", "coach"):
+                group.permissions.set(permissions)
+        user = CustomUser.objects.create_user("coach@bench.example.com", "coach")
+        user.groups.add(Group.objects.get(name="coach"))
+        # Built here, so the first timed check is not the one that builds it.
+        role_permissions.invalidate()
+        role_permissions.state()
+        return user
+
+    def measure(self, permission, get_user, options):
+        view = BenchView()
+        http_request = RequestFactory().patch("/")
+        checks = options["checks"]
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            for _ in range(checks):
+                request = Request(http_request)
+                request.user = get_user()
+                if not permission.has_permission(request, view):
+                    raise AssertionError(f"{type(permission).__name__} denied")
+            elapsed = time.perf_counter() - start
+        return {
+            "checks": checks,
+            "us_per_check": round(elapsed / checks * 1e6, 1),
+            "queries_per_check": round(queries / checks, 2),
+        }
@@ -0,0 +1,119 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+# The stack before API requests were routed around the browser middleware.
+LEGACY_MIDDLEWARE = [
+    "users.middleware.MetricsMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+]
+
+# Boots a worker the way gunicorn would, then times its first request.
+BOOT_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_assesment.settings")
+if sys.argv[1] == "warm":
+    from django_assesment.wsgi import application
+else:
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+boot = time.perf_counter() - start
+from django.conf import settings
+from django.test import RequestFactory
+settings.ALLOWED_HOSTS = ["testserver"]
+environ = RequestFactory().get(sys.argv[2]).environ
+start = time.perf_counter()
+application(environ, lambda status, headers: None).close()
+first = time.perf_counter() - start
+print(json.dumps({"boot": boot, "first_request": first}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker boot time and time to first request with and without "
+        "the warm-up hook, and the per-request cost of the middleware stack."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/users/")
+        parser.add_argument("--boots", type=int, default=5)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        results = {
+            "boot": {mode: self.boot(mode, options) for mode in ("plain", "warm")},
+            "middleware": self.middleware(options),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode, result in results["boot"].items():
+            self.stdout.write(
+                f"boot ({mode}): {result['boot_ms']}ms, "
+                f"first request {result['first_request_ms']}ms"
+            )
+        for stack, result in results["middleware"].items():
+            self.stdout.write(
+                f"{stack:>7} stack: {result['us_per_request']}us/request, "
+                f"{result['overhead_us']}us over no middleware"
+            )
+
+    def boot(self, mode, options):
+        runs = []
+        for _ in range(options["boots"]):
+            output = subprocess.run(
+                [sys.executable, "-c", BOOT_SCRIPT, mode, options["path"]],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        return {
+            "boot_ms": round(statistics.median(r["boot"] for r in runs) * 1000, 1),
+            "first_request_ms": round(
+                statistics.median(r["first_request"] for r in runs) * 1000, 1
+            ),
+        }
+
+    def middleware(self, options):
+        stacks = {
+            "none": [],
+            "legacy": LEGACY_MIDDLEWARE,
+            "current": settings.MIDDLEWARE,
+        }
+        environ = RequestFactory().get(options["path"]).environ
+        timings = {}
+        for name, stack in stacks.items():
+            with override_settings(MIDDLEWARE=stack, ALLOWED_HOSTS=["testserver"]):
+                handler = WSGIHandler()
+                for _ in range(50):
+                    handler(dict(environ), lambda status, headers: None).close()
+                start = time.perf_counter()
+                for _ in range(options["requests"]):
+                    handler(dict(environ), lambda status, headers: None).close()
+                timings[name] = (time.perf_counter() - start) / options["requests"]
+        return {
+            name: {
+                "us_per_request": round(seconds * 1e6, 1),
+                "overhead_us": round((seconds - timings["none"]) * 1e6, 1),
+            }
+            for name, seconds in timings.items()
+        }
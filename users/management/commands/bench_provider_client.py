@@ -0,0 +1,92 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users.bench.fake_provider import FakeProviderServer
+from users.bench.stats import summarize
+from users.providers import ProviderClient, ProviderError
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare bare requests.get with the pooled provider client against a "
+        "local fake provider that is slow for a share of requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--provider", choices=["google", "facebook"], default="google"
+        )
+        parser.add_argument("--delay", type=float, default=0.005)
+        parser.add_argument("--slow-ratio", type=float, default=0.02)
+        parser.add_argument("--slow-delay", type=float, default=2.0)
+        parser.add_argument("--read-timeout", type=float, default=0.5)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        server = FakeProviderServer(
+            delay=options["delay"],
+            slow_ratio=options["slow_ratio"],
+            slow_delay=options["slow_delay"],
+        )
+        with server:
+            client_settings = {
+                "CONNECT_TIMEOUT": 0.5,
+                "READ_TIMEOUT": options["read_timeout"],
+                "POOL_MAXSIZE": options["concurrency"],
+                "USERINFO_URLS": server.userinfo_urls,
+            }
+            url = server.userinfo_urls[options["provider"]]
+
+            def bare(token):
+                # What the views did before: a new connection and no deadline.
+                if options["provider"] == "google":
+                    requests.get(url, headers={"Authorization": f"Bearer {token}"})
+                else:
+                    requests.get(url, params={"access_token": token})
+
+            with override_settings(SOCIAL_PROVIDER_CLIENT=client_settings):
+                client = ProviderClient()
+                results = {
+                    "bare": self.run(bare, options),
+                    "pooled": self.run(
+                        lambda token: client.get_user_data(options["provider"], token),
+                        options,
+                    ),
+                }
+                client.close()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>8}: {result['rps']:>8} req/s  p50 {result['p50_ms']} ms  "
+                f"p99 {result['p99_ms']} ms  errors {result['errors']}"
+            )
+
+    def run(self, call, options):
+        errors = 0
+
+        def timed(i):
+            start = time.perf_counter()
+            try:
+                call(f"player{i}")
+                failed = False
+            except (ProviderError, requests.RequestException):
+                failed = True
+            return time.perf_counter() - start, failed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            outcomes = list(pool.map(timed, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+
+        errors = sum(1 for _, failed in outcomes if failed)
+        return summarize([latency for latency, _ in outcomes], elapsed, errors)
@@ -0,0 +1,105 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.validators import UniqueValidator
+
+from users.bench.database import scratch_database
+from users.models import CustomUser
+from users.serializers import BatchSignupSerializer, UserSignupSerializer
+
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+class CheckThenInsertSignupSerializer(UserSignupSerializer):
+    """The previous signup path: a UniqueValidator SELECT, then the INSERT."""
+
+    class Meta(UserSignupSerializer.Meta):
+        extra_kwargs = {
+            "email": {"validators": [UniqueValidator(CustomUser.objects.all())]}
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Count database round trips per signup for the check-then-insert path, "
+        "the single-INSERT path and the batch endpoint, on a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        # Round trips are what is measured, so use a cheap hasher.
+        with override_settings(
+            PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+            PASSWORD_HASHING={"USE_POOL": False},
+        ), scratch_database():
+            results = {
+                "check_then_insert": self.single(
+                    CheckThenInsertSignupSerializer, "old", options
+                ),
+                "single_insert": self.single(UserSignupSerializer, "new", options),
+                "batch": self.batch(options),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>17}: {result['statements_per_signup']} statements + "
+                f"{result['transaction_control_per_signup']} BEGIN/COMMIT per signup, "
+                f"{result['signups_per_s']} signups/s"
+            )
+
+    def single(self, serializer_class, prefix, options):
+        def run():
+            for i in range(options["signups"]):
+                serializer = serializer_class(data=self.item(f"{prefix}{i}"))
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        return self.measure(run, options["signups"])
+
+    def batch(self, options):
+        size = options["batch_size"]
+
+        def run():
+            for start in range(0, options["signups"], size):
+                items = [
+                    self.item(f"batch{i}")
+                    for i in range(start, min(start + size, options["signups"]))
+                ]
+                serializer = BatchSignupSerializer(data={"users": items})
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+        return self.measure(run, options["signups"])
+
+    def item(self, name):
+        return {
+            "email": f"{name}@bench.example.com",
+            "role": "football_player",
+            "password": "bench-password",
+            "password_confirmation": "bench-password",
+        }
+
+    def measure(self, run, signups):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        control = sum(
+            1 for query in queries if query["sql"].startswith(TRANSACTION_CONTROL)
+        )
+        return {
+            "signups": signups,
+            "statements_per_signup": round((len(queries) - control) / signups, 2),
+            "transaction_control_per_signup": round(control / signups, 2),
+            "signups_per_s": round(signups / elapsed, 1),
+        }
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.schema import directory, get_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the OpenAPI schema served at /schema/ and store it on disk. "
+        "Up-to-date artifacts are kept unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        schema = get_schema(rebuild=options["force"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Schema {schema.etag('json')} in {directory()} ({elapsed:.2f}s)."
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from users.bench.fake_provider import FakeProviderServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve fake Google/Facebook userinfo endpoints locally. Point "
+        "SOCIAL_PROVIDER_CLIENT['USERINFO_URLS'] at the printed URLs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--delay", type=float, default=0.0)
+        parser.add_argument("--slow-ratio", type=float, default=0.0)
+        parser.add_argument("--slow-delay", type=float, default=0.0)
+        parser.add_argument("--error-ratio", type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        server = FakeProviderServer(
+            (options["host"], options["port"]),
+            delay=options["delay"],
+            slow_ratio=options["slow_ratio"],
+            slow_delay=options["slow_delay"],
+            error_ratio=options["error_ratio"],
+        )
+        for provider, url in server.userinfo_urls.items():
+            self.stdout.write(f"{provider}: {url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,62 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.importer import UserImporter
+
+
+class Command(BaseCommand):
+    help = "Bulk import users from a CSV or NDJSON file (email, role, password)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin.")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--errors",
+            default=None,
+            help="Write the per-row error report (CSV) here instead of stderr.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            if path.endswith(".csv"):
+                fmt = "csv"
+            elif path.endswith((".ndjson", ".jsonl")):
+                fmt = "ndjson"
+            else:
+                raise CommandError("Cannot infer the format; pass --format.")
+
+        report_file = (
+            open(options["errors"], "w", newline="")
+            if options["errors"]
+            else sys.stderr
+        )
+        report = csv.writer(report_file)
+        report.writerow(["line", "email", "error"])
+
+        importer = UserImporter(
+            batch_size=options["batch_size"],
+            on_error=lambda *error: report.writerow(error),
+        )
+        source = (
+            sys.stdin
+            if path == "-"
+            else open(path, newline="", encoding="utf-8", errors="replace")
+        )
+        try:
+            result = importer.run(source, fmt)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report_file is not sys.stderr:
+                report_file.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['created']} users, {result['errors']} rows rejected."
+            )
+        )
@@ -0,0 +1,182 @@
+import json
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from users.bench.database import scratch_database
+from users.bench.fake_provider import CLIENT_ID, FakeProviderServer
+from users.bench.loadtest import SCENARIOS, run_scenario
+from users.bench.seed import seed_users
+from users.models import CustomUser
+from users.providers import provider_client
+from users.tokens import get_tokens_for_user
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+COMPARED = ("rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the users API in-process against a seeded scratch database "
+        "and a local fake OAuth provider. Reports throughput, latency "
+        "percentiles and queries per request for each endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=sorted(SCENARIOS),
+            help="Endpoint to load; repeat for several. Defaults to all.",
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument("--seed", type=int, default=10000)
+        parser.add_argument("--provider-delay", type=float, default=0.0)
+        parser.add_argument(
+            "--fast-hasher",
+            action="store_true",
+            help="Hash with MD5 to measure everything but password hashing.",
+        )
+        parser.add_argument("--output", help="Write the JSON results to this file.")
+        parser.add_argument(
+            "--compare", help="Results file of an earlier run to compare against."
+        )
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        names = options["scenario"] or list(SCENARIOS)
+        if options["seed"] < 1:
+            raise CommandError("--seed must be at least 1.")
+        hashers = {"PASSWORD_HASHERS": FAST_HASHERS} if options["fast_hasher"] else {}
+
+        setup_test_environment()
+        try:
+            with FakeProviderServer(
+                delay=options["provider_delay"]
+            ) as provider, tempfile.TemporaryDirectory() as jwks_directory:
+                with override_settings(
+                    SOCIAL_PROVIDER_CLIENT={"USERINFO_URLS": provider.userinfo_urls},
+                    GOOGLE_ID_TOKEN={
+                        "JWKS_URL": provider.jwks_url,
+                        "AUDIENCES": [CLIENT_ID],
+                        "CACHE_DIRECTORY": jwks_directory,
+                    },
+                    **hashers,
+                ), scratch_database(on_disk=True):
+                    context = self.prepare(options)
+                    context["provider"] = provider
+                    endpoints = {}
+                    for name in names:
+                        scenario = SCENARIOS[name]()
+                        scenario.setup(context, options["requests"])
+                        endpoints[name] = run_scenario(
+                            scenario, options["requests"], options["concurrency"]
+                        )
+                    database = connection.vendor
+        finally:
+            teardown_test_environment()
+            provider_client.close()
+
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": database,
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "seeded_users": options["seed"],
+                "fast_hasher": options["fast_hasher"],
+            },
+            "endpoints": endpoints,
+        }
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                results["comparison"] = self.compare(json.load(f), results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+
+    def prepare(self, options):
+        for _ in seed_users(options["seed"]):
+            pass
+        admin = CustomUser.objects.create_superuser(
+            email="loadtest-admin@example.com", password="password"
+        )
+        return {
+            "seeded": options["seed"],
+            "password": "password",
+            "admin_tokens": get_tokens_for_user(admin),
+        }
+
+    def compare(self, before, after):
+        """Percentage change of each metric for endpoints present in both runs."""
+        comparison = {"commit": before.get("meta", {}).get("commit"), "endpoints": {}}
+        for name, result in after["endpoints"].items():
+            old = before.get("endpoints", {}).get(name)
+            if old is None:
+                continue
+            comparison["endpoints"][name] = {
+                metric: (
+                    round((result[metric] - old[metric]) / old[metric] * 100, 1)
+                    if old.get(metric)
+                    else None
+                )
+                for metric in COMPARED
+            }
+        return comparison
+
+    def report(self, results):
+        meta = results["meta"]
+        self.stdout.write(
+            f"commit {meta['commit']}, {meta['database']}, "
+            f"{meta['requests']} requests x {meta['concurrency']} threads"
+        )
+        self.stdout.write(
+            f"{'endpoint':>21} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+            f"{'queries':>8} {'errors':>7}"
+        )
+        for name, result in results["endpoints"].items():
+            self.stdout.write(
+                f"{name:>21} {result['rps']:>8} {result['p50_ms']:>8} "
+                f"{result['p95_ms']:>8} {result['p99_ms']:>8} "
+                f"{result['queries_per_request']:>8} {result['errors']:>7}"
+            )
+        comparison = results.get("comparison")
+        if comparison:
+            self.stdout.write(f"change since {comparison['commit']} (%):")
+            for name, deltas in comparison["endpoints"].items():
+                self.stdout.write(
+                    f"{name:>21} "
+                    + " ".join(f"{metric}={deltas[metric]}" for metric in COMPARED)
+                )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import PasswordResetToken
+
+
+class Command(BaseCommand):
+    help = "Delete expired password reset tokens in small chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between chunks.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            ids = list(
+                PasswordResetToken.objects.filter(expires_at__lt=now).values_list(
+                    "pk", flat=True
+                )[: options["chunk_size"]]
+            )
+            if not ids:
+                break
+            deleted += PasswordResetToken.objects.filter(pk__in=ids).delete()[0]
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(f"Deleted {deleted} expired password reset tokens.")
@@ -0,0 +1,54 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from users.models import CustomUser, StatCounter
+from users.stats import role_key, signups_key
+
+
+class Command(BaseCommand):
+    help = "Recompute the role and daily-signup counters from the user table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        snapshot = CustomUser.objects.aggregate(Max("pk"))["pk__max"] or 0
+        counts = Counter()
+        last_pk = 0
+        while last_pk < snapshot:
+            chunk = list(
+                CustomUser.objects.filter(pk__gt=last_pk, pk__lte=snapshot)
+                .order_by("pk")
+                .values_list("pk", "role", "is_active", "date_joined")[
+                    : options["chunk_size"]
+                ]
+            )
+            if not chunk:
+                break
+            self.count(counts, chunk)
+            last_pk = chunk[-1][0]
+
+        with transaction.atomic():
+            # Lock the counters so signups committing meanwhile either land in
+            # the tail counted below or wait and apply on top of the rebuild.
+            list(StatCounter.objects.select_for_update().values_list("pk"))
+            tail = CustomUser.objects.filter(pk__gt=snapshot).values_list(
+                "pk", "role", "is_active", "date_joined"
+            )
+            self.count(counts, tail.iterator())
+            StatCounter.objects.all().delete()
+            StatCounter.objects.bulk_create(
+                StatCounter(name=name, value=value) for name, value in counts.items()
+            )
+
+        self.stdout.write(f"Rebuilt {len(counts)} counters.")
+
+    def count(self, counts, rows):
+        for _, role, is_active, date_joined in rows:
+            if is_active:
+                counts[role_key(role)] += 1
+            counts[signups_key(timezone.localdate(date_joined))] += 1
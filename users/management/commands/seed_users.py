@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.bench.seed import seed_users
+
+
+class Command(BaseCommand):
+    help = "Insert synthetic users (seed<N>@example.com) for benchmarks and load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--start", type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = 0
+        for total in seed_users(
+            options["count"],
+            batch_size=options["batch_size"],
+            prefix=options["prefix"],
+            password=options["password"],
+            start=options["start"],
+        ):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{total} users")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {total} users in {elapsed:.1f}s "
+                f"({total / elapsed if elapsed else 0:.0f} rows/s)."
+            )
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import drain, get_setting
+
+
+class Command(BaseCommand):
+    help = "Send queued emails from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the outbox is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain what is due, then exit."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or get_setting("BATCH_SIZE")
+        total_sent = total_failed = 0
+
+        try:
+            while True:
+                sent, failed = drain(batch_size)
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < batch_size:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(f"Sent {total_sent} emails, {total_failed} failed.")
@@ -0,0 +1,385 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULTS = {
+    "DIRECTORY": None,
+    "FLUSH_INTERVAL": 5.0,
+    "TOKEN": None,
+}
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Name of the view handling the current request, set by MetricsMiddleware
+# so phase timings can be attributed to it.
+current_view = ContextVar("metrics_view", default="none")
+
+
+def get_setting(name):
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: value for labels, value in self.series.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram:
+    """Fixed-bucket histogram; each series is `[bucket counts..., +Inf], sum`.
+
+    Counts are kept per bucket rather than cumulatively, so an observation
+    is a bisect and two additions under the lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                labels: [list(counts), total]
+                for labels, (counts, total) in self.series.items()
+            }
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def samples(self, labels, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            bucket_labels = (*labels, ("le", format_value(bound)))
+            yield f"{self.name}_bucket", bucket_labels, cumulative
+        yield f"{self.name}_sum", labels, total
+        yield f"{self.name}_count", labels, cumulative
+
+
+class Gauge:
+    """Current values, read from `function` (`{labels: value}`) when collected.
+
+    Across processes the values of the live ones are summed. An exiting
+    process does not write its gauges, and those of a process that is gone
+    without exiting cleanly (SIGKILL, OOM) are skipped when collecting, so
+    a finished worker's last values are not reported.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels, function):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.function = function
+
+    def snapshot(self):
+        return dict(self.function())
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, under another user.
+        pass
+    return True
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    """In-process metrics, optionally shared between worker processes.
+
+    With `METRICS["DIRECTORY"]` set, every process (each gunicorn worker,
+    the outbox worker, ...) periodically writes its totals to
+    `<directory>/<pid>.json` and `/metrics` sums the files of all of them.
+    Files of exited workers are kept so counters never go backwards; a new
+    process that reuses a pid carries the old file's totals forward.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started = False
+        self._carried = {}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def counter(self, name, documentation, labels):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, labels, function):
+        return self.register(Gauge(name, documentation, labels, function))
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _reset_after_fork(self):
+        # A forked worker must not report what its parent had counted.
+        for metric in self.metrics.values():
+            metric.series = {}
+            metric._lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started = False
+        self._carried = {}
+
+    def ensure_started(self):
+        """Start this process's flusher thread, if a directory is configured."""
+        if self._started:
+            return
+        with self._lock:
+            if self._started or not get_setting("DIRECTORY"):
+                self._started = True
+                return
+            path = self.path()
+            if os.path.exists(path):
+                self._carried = {
+                    name: series
+                    for name, series in self.load(path).items()
+                    if name in self.metrics and self.metrics[name].kind != "gauge"
+                }
+            thread = threading.Thread(
+                target=self._flush_loop, name="metrics-flusher", daemon=True
+            )
+            thread.start()
+            atexit.register(self.flush, live=False)
+            self._started = True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(get_setting("FLUSH_INTERVAL"))
+            self.flush()
+
+    def path(self, directory=None):
+        return os.path.join(
+            directory or get_setting("DIRECTORY"), f"{os.getpid()}.json"
+        )
+
+    def snapshot(self, live=True):
+        """`{metric name: {labels: value}}` for this process.
+
+        Gauges are left out unless `live`.
+        """
+        data = {
+            name: metric.snapshot()
+            for name, metric in self.metrics.items()
+            if live or metric.kind != "gauge"
+        }
+        return self.combine([self._carried, data]) if self._carried else data
+
+    def combine(self, snapshots):
+        combined = {}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                target = combined.setdefault(name, {})
+                for labels, value in series.items():
+                    if labels in target:
+                        target[labels] = metric.merge(target[labels], value)
+                    else:
+                        target[labels] = value
+        return combined
+
+    def flush(self, live=True):
+        directory = get_setting("DIRECTORY")
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory)
+        tmp = f"{path}.tmp"
+        with self._flush_lock:
+            data = {
+                name: [[list(labels), value] for labels, value in series.items()]
+                for name, series in self.snapshot(live).items()
+            }
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {
+            name: {tuple(labels): value for labels, value in series}
+            for name, series in data.items()
+        }
+
+    def collect(self):
+        """Totals across all processes sharing the directory, or this one's."""
+        directory = get_setting("DIRECTORY")
+        if not directory:
+            return self.snapshot()
+        self.ensure_started()
+        self.flush()
+        return self.combine(
+            self.load_live(path)
+            for path in glob.glob(os.path.join(directory, "*.json"))
+        )
+
+    def load_live(self, path):
+        """`load(path)`, without the gauges if its process is no longer running."""
+        data = self.load(path)
+        try:
+            pid = int(os.path.basename(path).removesuffix(".json"))
+        except ValueError:
+            return data
+        if pid_alive(pid):
+            return data
+        return {
+            name: series
+            for name, series in data.items()
+            if name in self.metrics and self.metrics[name].kind != "gauge"
+        }
+
+    def render(self):
+        """The collected metrics in the Prometheus text exposition format."""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(collected.get(name, {}).items()):
+                pairs = [*zip(metric.labels, labels)]
+                for sample, sample_labels, sample_value in metric.samples(pairs, value):
+                    rendered = ",".join(
+                        f'{key}="{escape(label)}"' for key, label in sample_labels
+                    )
+                    lines.append(f"{sample}{{{rendered}}} {format_value(sample_value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "users_http_requests_total",
+    "HTTP requests by view, method and status code.",
+    ("view", "method", "status"),
+)
+request_seconds = registry.histogram(
+    "users_http_request_duration_seconds",
+    "Time spent handling a request, including middleware.",
+    ("view", "method"),
+)
+request_queries = registry.histogram(
+    "users_http_request_queries",
+    "Database queries executed per request.",
+    ("view",),
+    buckets=QUERY_BUCKETS,
+)
+phase_seconds = registry.histogram(
+    "users_phase_duration_seconds",
+    "Time spent in a phase of request handling (orm, password_hashing, "
+    "provider_http, mail_send, jwt_sign).",
+    ("phase", "view"),
+)
+
+
+@contextmanager
+def timed(phase):
+    """Time the block as `phase` of the current view's work.
+
+    Also usable as a decorator.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.ensure_started()
+        phase_seconds.observe(time.perf_counter() - start, phase, current_view.get())
+
+
+def record_request(view, method, status, duration, queries=None, query_seconds=None):
+    registry.ensure_started()
+    requests_total.inc(view, method, str(status))
+    request_seconds.observe(duration, view, method)
+    if queries is not None:
+        request_queries.observe(queries, view)
+        phase_seconds.observe(query_seconds, "orm", view)
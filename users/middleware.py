@@ -0,0 +1,158 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.db import connections
+from django.middleware import clickjacking, csrf
+
+from . import metrics
+
+DEFAULTS = {
+    "PATH_PREFIXES": ("/api/",),
+}
+
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+def get_setting(name):
+    return getattr(settings, "API_PIPELINE", {}).get(name, DEFAULTS[name])
+
+
+class QueryCounter:
+    """`execute_wrapper` that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Record latency, status and query count of every request per view.
+
+    Views are labelled by URL name, so the number of series stays bounded;
+    requests that resolve to no view are counted as "unmatched". Place it
+    first in MIDDLEWARE so the rest of the stack is included in the timing.
+
+    Under ASGI the ORM runs on other threads than the request, so queries
+    are only counted for requests served synchronously.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # A sync process_view would cost a thread hop per request.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            metrics.current_view.set("none")
+        self.record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, duration, queries=None):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match and match.view_name else "unmatched"
+        method = request.method if request.method in METHODS else "other"
+        metrics.record_request(
+            view,
+            method,
+            response.status_code,
+            duration,
+            queries.count if queries else None,
+            queries.seconds if queries else None,
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics.current_view.set(request.resolver_match.view_name or "unmatched")
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        MetricsMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+
+class BrowserOnlyMixin:
+    """Skip a browser-oriented middleware for API paths.
+
+    The API authenticates with JWT and never reads sessions, messages or
+    CSRF cookies, so requests under `API_PIPELINE["PATH_PREFIXES"]` go
+    straight to the next layer. The subclasses below keep Django's class
+    hierarchy, so the admin's system checks still recognise them.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.api_prefixes = tuple(get_setting("PATH_PREFIXES"))
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.api_prefixes):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(BrowserOnlyMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(BrowserOnlyMixin, csrf.CsrfViewMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.async_mode:
+            # The check does no I/O; a sync process_view would cost a thread
+            # hop on every request.
+            self.process_view = self.aprocess_view
+
+    async def aprocess_view(self, request, callback, callback_args, callback_kwargs):
+        return CsrfViewMiddleware.process_view(
+            self, request, callback, callback_args, callback_kwargs
+        )
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if request.path_info.startswith(self.api_prefixes):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class AuthenticationMiddleware(
+    BrowserOnlyMixin, auth_middleware.AuthenticationMiddleware
+):
+    pass
+
+
+class MessageMiddleware(BrowserOnlyMixin, messages_middleware.MessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(BrowserOnlyMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
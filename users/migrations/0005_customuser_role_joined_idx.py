@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0004_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(
+                fields=["role", "date_joined", "id"], name="user_role_joined_idx"
+            ),
+        ),
+    ]
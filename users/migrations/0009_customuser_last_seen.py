@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_customuser_joined_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="last_seen",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
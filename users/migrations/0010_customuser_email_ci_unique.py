@@ -0,0 +1,65 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:58
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import Lower
+
+
+def dedupe_emails(apps, schema_editor):
+    """Keep one account per case-insensitive email and retire the others.
+
+    The kept account is the one that logged in last (else the oldest). The
+    others are deactivated, their tokens revoked and their email prefixed
+    with `duplicate-<id>-` so the constraint can be created; their social
+    logins move to the kept account. Nothing is deleted.
+    """
+    CustomUser = apps.get_model("users", "CustomUser")
+    StatCounter = apps.get_model("users", "StatCounter")
+    UserSocialAuth = apps.get_model("social_django", "UserSocialAuth")
+    max_length = CustomUser._meta.get_field("email").max_length
+
+    duplicated = (
+        CustomUser.objects.annotate(email_lower=Lower("email"))
+        .values("email_lower")
+        .annotate(accounts=Count("id"))
+        .filter(accounts__gt=1)
+        .values_list("email_lower", flat=True)
+    )
+    for email in list(duplicated):
+        keep, *others = (
+            CustomUser.objects.annotate(email_lower=Lower("email"))
+            .filter(email_lower=email)
+            .order_by(F("last_login").desc(nulls_last=True), "id")
+        )
+        UserSocialAuth.objects.filter(user__in=others).update(user=keep)
+        for user in others:
+            if user.is_active:
+                StatCounter.objects.filter(
+                    name=f"role:{user.role or 'unassigned'}"
+                ).update(value=F("value") - 1)
+            prefix = f"duplicate-{user.pk}-"
+            user.email = prefix + user.email[: max_length - len(prefix)]
+            user.is_active = False
+            user.token_version += 1
+            user.save(update_fields=["email", "is_active", "token_version"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("social_django", "0016_alter_usersocialauth_extra_data"),
+        ("users", "0009_customuser_last_seen"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="customuser",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("email"),
+                name="user_email_ci_unique",
+            ),
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 ROLE_CHOICES = (
     ("admin", "Admin"),
@@ -13,6 +15,16 @@ ROLE_CHOICES = (
 )
 
 
+def email_prefix_q(prefix):
+    """Match emails starting with `prefix` as a range the email index can serve.
+
+    `startswith` alone compiles to LIKE, which PostgreSQL only runs against
+    an index under the C collation; the range bounds work on any backend.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return models.Q(email__gte=prefix, email__lt=upper, email__startswith=prefix)
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, role=None, password=None, **extra_fields):
         if not email:
@@ -33,6 +45,10 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password=password, **extra_fields)
 
+    def get_by_natural_key(self, email):
+        # Emails are unique regardless of case (user_email_ci_unique).
+        return self.get(email__lower=Lower(models.Value(email)))
+
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True)
@@ -40,11 +56,100 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    # Written in batches by users.activity, so it trails by up to a minute.
+    last_seen = models.DateTimeField(null=True, blank=True)
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["role"]
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the user directory.
+            models.Index(
+                fields=["role", "date_joined", "id"], name="user_role_joined_idx"
+            ),
+            # Keyset chunks of the user export.
+            models.Index(fields=["date_joined", "id"], name="user_joined_idx"),
+        ]
+        constraints = [
+            # Foo@example.com and foo@example.com are one account; lookups
+            # go through `email__lower` to use this index.
+            models.UniqueConstraint(Lower("email"), name="user_email_ci_unique"),
+        ]
+
     def __str__(self):
         return self.email
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        # Tokens issued for the old password stop validating.
+        self.token_version += 1
+
+
+CustomUser._meta.get_field("email").register_lookup(Lower)
+
+
+class EmailOutbox(models.Model):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to}"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class StatCounter(models.Model):
+    """A named running count, e.g. `role:coach` or `signups:2024-10-22`."""
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class PasswordResetToken(models.Model):
+    """An outstanding password reset; only a SHA-256 of the token is stored."""
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="reset_tokens"
+    )
+    token_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"reset for user {self.user_id}"
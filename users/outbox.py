@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import timed
+from .models import EmailOutbox
+
+DEFAULTS = {
+    "BATCH_SIZE": 100,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF_BASE": 30,
+    "BACKOFF_MAX": 3600,
+    "LEASE": 300,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "EMAIL_OUTBOX", {}).get(name, DEFAULTS[name])
+
+
+def enqueue_mail(subject, body, from_email, to):
+    """Queue one message for the outbox worker; a single INSERT."""
+    return EmailOutbox.objects.create(
+        subject=subject, body=body, from_email=from_email, to=to
+    )
+
+
+def enqueue_mails(messages):
+    """Queue `(subject, body, from_email, to)` messages; a single INSERT."""
+    return EmailOutbox.objects.bulk_create(
+        EmailOutbox(subject=subject, body=body, from_email=from_email, to=to)
+        for subject, body, from_email, to in messages
+    )
+
+
+def backoff(attempts):
+    return timedelta(
+        seconds=min(
+            get_setting("BACKOFF_BASE") * 2 ** (attempts - 1),
+            get_setting("BACKOFF_MAX"),
+        )
+    )
+
+
+def claim(batch_size):
+    """Take up to `batch_size` due messages off the queue for `LEASE` seconds.
+
+    Rows are locked with SKIP LOCKED where the database supports it and
+    pushed `LEASE` seconds into the future in the same short transaction,
+    so several workers can drain the same outbox without sending a
+    message twice. A worker that dies mid-batch leaves its messages to be
+    picked up again once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        if batch:
+            EmailOutbox.objects.filter(pk__in=[item.pk for item in batch]).update(
+                next_attempt_at=now + timedelta(seconds=get_setting("LEASE"))
+            )
+    return batch
+
+
+def drain(batch_size=None, connection=None):
+    """Send one batch of due messages over a single mail connection.
+
+    Messages are claimed first and sent outside any transaction. A failure
+    to open the connection counts as a failed attempt of every message in
+    the batch. Returns `(sent, failed)`.
+    """
+    batch = claim(batch_size or get_setting("BATCH_SIZE"))
+    if not batch:
+        return 0, 0
+    max_attempts = get_setting("MAX_ATTEMPTS")
+
+    sent_ids, failed = [], []
+
+    def fail(item, error):
+        item.attempts += 1
+        item.last_error = str(error) or type(error).__name__
+        if item.attempts >= max_attempts:
+            item.status = EmailOutbox.FAILED
+        else:
+            item.next_attempt_at = timezone.now() + backoff(item.attempts)
+        failed.append(item)
+
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for item in batch:
+            fail(item, e)
+    else:
+        try:
+            for item in batch:
+                message = EmailMessage(
+                    item.subject,
+                    item.body,
+                    item.from_email,
+                    [item.to],
+                    connection=connection,
+                )
+                try:
+                    with timed("mail_send"):
+                        message.send()
+                except Exception as e:
+                    fail(item, e)
+                else:
+                    sent_ids.append(item.pk)
+        finally:
+            connection.close()
+
+    if sent_ids:
+        EmailOutbox.objects.filter(pk__in=sent_ids).update(
+            status=EmailOutbox.SENT, sent_at=timezone.now()
+        )
+    if failed:
+        EmailOutbox.objects.bulk_update(
+            failed, ["attempts", "last_error", "status", "next_attempt_at"]
+        )
+    return len(sent_ids), len(failed)
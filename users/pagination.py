@@ -0,0 +1,106 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks past the last row's full ordering key.
+
+    Unlike offset pagination, every page is one index range scan, however
+    deep the client has paged. `ordering` must end in a unique field and be
+    backed by a composite index in the same order.
+    """
+
+    ordering = ("role", "date_joined", "id")
+    datetime_fields = ("date_joined",)
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset.order_by(*self.ordering)[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = (
+            [getattr(rows[-1], field) for field in self.ordering] if rows else None
+        )
+        return rows
+
+    def after(self, position):
+        # (a, b, c) > (x, y, z) spelled out for backends without row values.
+        condition, equal = Q(), {}
+        for field, value in zip(self.ordering, position):
+            condition |= Q(**equal, **{f"{field}__gt": value})
+            equal[field] = value
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            for index, field in enumerate(self.ordering):
+                value = position[index]
+                if isinstance(value, bool) or not isinstance(value, (str, int)):
+                    raise ValueError
+                if field in self.datetime_fields:
+                    position[index] = parse_datetime(value)
+                    if position[index] is None:
+                        raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if field in self.datetime_fields else value
+            for field, value in zip(self.ordering, position)
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
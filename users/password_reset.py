@@ -0,0 +1,79 @@
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import hashing
+from .models import CustomUser, PasswordResetToken
+from .outbox import enqueue_mails
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def make_tokens(users):
+    """Store a new reset token for each user and return them, in one INSERT.
+
+    Tokens are valid for `PASSWORD_RESET_TIMEOUT` seconds or until used.
+    """
+    tokens = [secrets.token_urlsafe(32) for _ in users]
+    expires_at = timezone.now() + timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+    PasswordResetToken.objects.bulk_create(
+        PasswordResetToken(
+            user=user, token_hash=hash_token(token), expires_at=expires_at
+        )
+        for user, token in zip(users, tokens)
+    )
+    return tokens
+
+
+def send_reset_emails(users):
+    """Issue reset tokens to `users` and queue their emails; two INSERTs."""
+    tokens = make_tokens(users)
+    enqueue_mails(
+        (
+            "Password Reset",
+            f"Your password reset token is: {token}\nUse this token to reset your password.",
+            "from@example.com",
+            user.email,
+        )
+        for user, token in zip(users, tokens)
+    )
+
+
+def reset_password(email, token, new_password):
+    """Set the password of `email`'s user if `token` is theirs and unexpired.
+
+    The token is checked first, without locking, so an invalid one costs a
+    single indexed query and no hashing. The new password is then hashed
+    outside any transaction, and a transaction of two statements applies
+    it: a DELETE of all of the user's reset tokens, conditional on `token`
+    still being one of them, and the UPDATE of the password. The DELETE
+    locks the token rows, so of concurrent requests with the same token
+    exactly one succeeds. Returns whether the password was reset.
+
+    Like any revocation, other workers may accept the user's old JWTs for
+    up to `TOKEN_VERSION_CACHE["TTL"]` seconds.
+    """
+    owner = CustomUser.objects.filter(
+        email__lower=Lower(Value(email)),
+        reset_tokens__token_hash=hash_token(token),
+        reset_tokens__expires_at__gt=timezone.now(),
+    )
+    if not owner.exists():
+        return False
+    password = hashing.make_password(new_password)
+    with transaction.atomic():
+        consumed, _ = PasswordResetToken.objects.filter(user__in=owner).delete()
+        if not consumed:
+            return False
+        CustomUser.objects.filter(email__lower=Lower(Value(email))).update(
+            password=password, token_version=F("token_version") + 1
+        )
+    return True
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from rest_framework.permissions import BasePermission, DjangoModelPermissions
+
+from .models import ROLE_CHOICES
+
+DEFAULTS = {
+    "SYNC_INTERVAL": 5.0,
+}
+
+ROLES = [value for value, _ in ROLE_CHOICES]
+VERSION_KEY = "role_permissions:version"
+
+
+def get_setting(name):
+    return getattr(settings, "ROLE_PERMISSIONS", {}).get(name, DEFAULTS[name])
+
+
+class RolePermissionMap:
+    """Each role's permissions as a bitmap, built once instead of per check.
+
+    A role has the permissions of the group named after it; the groups a
+    user belongs to and their own `user_permissions` are not consulted.
+    Every permission granted to some role gets a bit, so a check is a dict
+    lookup per permission and one AND, without touching the database.
+
+    Changing the role groups or their permissions invalidates the map
+    through signals and bumps a version in the default cache; other
+    processes compare that version every `SYNC_INTERVAL` seconds and
+    rebuild, with one query, when it moved.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = None  # ({"app_label.codename": bit}, {role: bitmap})
+        self._version = None
+        self._checked_at = 0.0
+
+    def build(self):
+        bits, roles = {}, dict.fromkeys(ROLES, 0)
+        rows = Group.permissions.through.objects.filter(
+            group__name__in=ROLES
+        ).values_list(
+            "group__name", "permission__content_type__app_label", "permission__codename"
+        )
+        for role, app_label, codename in rows:
+            bit = bits.setdefault(f"{app_label}.{codename}", len(bits))
+            roles[role] |= 1 << bit
+        return bits, roles
+
+    def state(self):
+        now = self.clock()
+        state = self._state
+        if state is not None and now < self._checked_at + get_setting("SYNC_INTERVAL"):
+            return state
+        with self._lock:
+            version = cache.get(VERSION_KEY)
+            if self._state is None or version != self._version:
+                self._state = self.build()
+                self._version = version
+            self._checked_at = now
+            return self._state
+
+    def has_perms(self, role, perms):
+        bits, roles = self.state()
+        required = 0
+        for perm in perms:
+            bit = bits.get(perm)
+            if bit is None:
+                # No role has it.
+                return False
+            required |= 1 << bit
+        return roles.get(role, 0) & required == required
+
+    def invalidate(self):
+        cache.add(VERSION_KEY, 0, timeout=None)
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            # Evicted in between; any new value makes processes rebuild.
+            cache.set(VERSION_KEY, 1, timeout=None)
+        with self._lock:
+            self._state = None
+
+
+role_permissions = RolePermissionMap()
+
+
+class RolePermission(BasePermission):
+    """Allows users whose role has all of the view's `required_permissions`.
+
+    `required_permissions` is a list of `app_label.codename` strings, or a
+    dict of them per HTTP method. The check reads the role from the user
+    (the token's role claim, for `ClaimsUser`) and never queries.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return role_permissions.has_perms(
+            getattr(user, "role", None), self.get_required_permissions(request, view)
+        )
+
+    def get_required_permissions(self, request, view):
+        required = getattr(view, "required_permissions", ())
+        if isinstance(required, dict):
+            return required.get(request.method, ())
+        return required
+
+
+class RoleModelPermissions(DjangoModelPermissions):
+    """`DjangoModelPermissions` answered from the role map instead of `has_perms`."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or (not user.is_authenticated and self.authenticated_users_only):
+            return False
+        if getattr(view, "_ignore_model_permissions", False):
+            return True
+        queryset = self._queryset(view)
+        perms = self.get_required_permissions(request.method, queryset.model)
+        return role_permissions.has_perms(getattr(user, "role", None), perms)
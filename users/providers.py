@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from .metrics import timed
+
+DEFAULTS = {
+    "CONNECT_TIMEOUT": 2.0,
+    "READ_TIMEOUT": 5.0,
+    "POOL_CONNECTIONS": 4,
+    "POOL_MAXSIZE": 20,
+    "ASYNC_POOL_MAXSIZE": 200,
+    "FAILURE_THRESHOLD": 5,
+    "RECOVERY_TIMEOUT": 30.0,
+    "USERINFO_URLS": {
+        "google": "https://www.googleapis.com/oauth2/v3/userinfo",
+        "facebook": "https://graph.facebook.com/me",
+    },
+}
+
+
+def get_setting(name):
+    return getattr(settings, "SOCIAL_PROVIDER_CLIENT", {}).get(name, DEFAULTS[name])
+
+
+class ProviderError(Exception):
+    pass
+
+
+class ProviderUnavailable(ProviderError):
+    """The provider timed out, errored, or its circuit is open."""
+
+
+class CircuitBreaker:
+    """Fail fast after `failure_threshold` consecutive failures.
+
+    After `recovery_timeout` seconds a single trial call is let through; its
+    outcome closes the circuit again or re-opens it for another period.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, recovery_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and self.clock() - self.opened_at >= self.recovery_timeout
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+def userinfo_request(provider, access_token):
+    """`(url, kwargs)` of the userinfo call, or None for an unknown provider."""
+    urls = get_setting("USERINFO_URLS")
+    if provider not in urls:
+        return None
+    if provider == "google":
+        kwargs = {"headers": {"Authorization": f"Bearer {access_token}"}}
+    else:
+        kwargs = {"params": {"fields": "id,name,email", "access_token": access_token}}
+    return urls[provider], kwargs
+
+
+def user_data_from_response(provider, breaker, response):
+    """Profile from a `requests` or `httpx` response; None if the token was rejected."""
+    if response.status_code >= 500:
+        breaker.record_failure()
+        raise ProviderUnavailable(f"{provider} returned status {response.status_code}.")
+
+    breaker.record_success()
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except ValueError as e:
+        raise ProviderError(f"{provider} returned an invalid response.") from e
+
+
+def new_breaker():
+    return CircuitBreaker(
+        get_setting("FAILURE_THRESHOLD"), get_setting("RECOVERY_TIMEOUT")
+    )
+
+
+class ProviderClient:
+    """Keep-alive HTTP client for the social providers' userinfo endpoints.
+
+    Each provider gets its own connection pool and circuit breaker, so a
+    degraded Facebook does not slow down Google logins.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider):
+        with self._lock:
+            if provider not in self._sessions:
+                # Imported on first use to keep `requests` out of worker boot.
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=get_setting("POOL_CONNECTIONS"),
+                    pool_maxsize=get_setting("POOL_MAXSIZE"),
+                    max_retries=0,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[provider] = session
+                self._breakers[provider] = new_breaker()
+            return self._sessions[provider], self._breakers[provider]
+
+    def breaker(self, provider):
+        return self._get(provider)[1]
+
+    def get_user_data(self, provider, access_token):
+        """Return the provider's profile for `access_token`, or None if rejected."""
+        request = userinfo_request(provider, access_token)
+        if request is None:
+            return None
+        url, kwargs = request
+
+        import requests
+
+        session, breaker = self._get(provider)
+        if not breaker.allow():
+            raise ProviderUnavailable(f"{provider} is temporarily unavailable.")
+
+        try:
+            with timed("provider_http"):
+                response = session.get(
+                    url,
+                    timeout=(
+                        get_setting("CONNECT_TIMEOUT"),
+                        get_setting("READ_TIMEOUT"),
+                    ),
+                    **kwargs,
+                )
+        except requests.RequestException as e:
+            breaker.record_failure()
+            raise ProviderUnavailable(f"{provider} request failed: {e}") from e
+        return user_data_from_response(provider, breaker, response)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._breakers.clear()
+
+
+class AsyncProviderClient:
+    """`ProviderClient` for async views, on `httpx.AsyncClient`.
+
+    A pending request holds a connection but no thread, so one worker can
+    wait on many slow provider calls at once; `ASYNC_POOL_MAXSIZE` bounds
+    them per provider. Clients belong to an event loop, so each loop gets
+    its own, closed when the loop shuts down (`asyncio.run()` and
+    `async_to_sync` finalize async generators on the way out).
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._breakers = {}
+
+    async def _closing(self, clients):
+        """Suspended for the loop's lifetime; closes `clients` when finalized."""
+        try:
+            yield
+        finally:
+            self._clients.pop(asyncio.get_running_loop(), None)
+            for client in clients.values():
+                await client.aclose()
+
+    async def _get(self, provider):
+        # Imported on first use to keep `httpx` out of worker boot.
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            clients = {}
+            closer = self._closing(clients)
+            # Started so the loop tracks it; `closer` is kept alive with the
+            # clients, or it would be collected and close them right away.
+            await anext(closer)
+            self._clients[loop] = (clients, closer)
+        clients, _ = self._clients[loop]
+        if provider not in clients:
+            size = get_setting("ASYNC_POOL_MAXSIZE")
+            clients[provider] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=size, max_keepalive_connections=size
+                ),
+                timeout=httpx.Timeout(
+                    get_setting("READ_TIMEOUT"),
+                    connect=get_setting("CONNECT_TIMEOUT"),
+                ),
+            )
+        return clients[provider], self.breaker(provider)
+
+    def breaker(self, provider):
+        if provider not in self._breakers:
+            self._breakers[provider] = new_breaker()
+        return self._breakers[provider]
+
+    async def get_user_data(self, provider, access_token):
+        """Return the provider's profile for `access_token`, or None if rejected."""
+        request = userinfo_request(provider, access_token)
+        if request is None:
+            return None
+        url, kwargs = request
+
+        import httpx
+
+        client, breaker = await self._get(provider)
+        if not breaker.allow():
+            raise ProviderUnavailable(f"{provider} is temporarily unavailable.")
+
+        try:
+            with timed("provider_http"):
+                response = await client.get(url, **kwargs)
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            raise ProviderUnavailable(f"{provider} request failed: {e}") from e
+        return user_data_from_response(provider, breaker, response)
+
+    async def aclose(self):
+        """Close the running loop's clients and reset the breakers."""
+        self._breakers.clear()
+        entry = self._clients.get(asyncio.get_running_loop())
+        if entry is not None:
+            await entry[1].aclose()
+
+
+provider_client = ProviderClient()
+async_provider_client = AsyncProviderClient()
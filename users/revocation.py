@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+DEFAULTS = {
+    "BLOOM_CAPACITY": 100000,
+    "BLOOM_ERROR_RATE": 0.001,
+    "SYNC_INTERVAL": 1.0,
+    "REBUILD_INTERVAL": 3600,
+    "SAFETY_LAG": 5,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "TOKEN_REVOCATION", {}).get(name, DEFAULTS[name])
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, key):
+        digest = hashlib.sha256(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for index in self._indexes(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, key):
+        return all(
+            self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key)
+        )
+
+
+class RevocationStore:
+    """Revoked refresh-token jtis: a Bloom filter in front of `RevokedToken`.
+
+    A jti the filter has never seen is not revoked, so the common check is
+    answered from memory. Revocations made by other workers are pulled in
+    incrementally every `SYNC_INTERVAL` seconds, and the filter is rebuilt
+    from the unexpired rows every `REBUILD_INTERVAL` seconds.
+
+    Primary keys are allocated before commit, so a row can become visible
+    after one with a higher pk. Each sync therefore reads every row above
+    `_floor`, which only moves past rows revoked more than `SAFETY_LAG`
+    seconds ago; the rows above it already in the filter are kept in
+    `_recent`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._capacity = 0
+        self._count = 0
+        self._floor = 0
+        self._recent = set()
+        self._built_at = 0.0
+        self._synced_at = 0.0
+
+    def _add(self, rows):
+        """Add `(pk, jti, revoked_at)` rows, in pk order, and advance `_floor`."""
+        cutoff = timezone.now() - timedelta(seconds=get_setting("SAFETY_LAG"))
+        settled = True
+        for pk, jti, revoked_at in rows:
+            if pk not in self._recent:
+                self._bloom.add(jti)
+                self._recent.add(pk)
+                self._count += 1
+            settled = settled and revoked_at < cutoff
+            if settled:
+                self._floor = pk
+        self._recent = {pk for pk in self._recent if pk > self._floor}
+
+    def _rebuild(self, now):
+        rows = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        capacity = max(get_setting("BLOOM_CAPACITY"), 2 * rows.count())
+        self._bloom = BloomFilter(capacity, get_setting("BLOOM_ERROR_RATE"))
+        self._capacity, self._count = capacity, 0
+        self._floor, self._recent = 0, set()
+        self._add(rows.order_by("pk").values_list("pk", "jti", "revoked_at").iterator())
+        self._built_at = self._synced_at = now
+
+    def _sync(self):
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._bloom is None
+                or now - self._built_at >= get_setting("REBUILD_INTERVAL")
+                or self._count >= self._capacity
+            ):
+                self._rebuild(now)
+            elif now - self._synced_at >= get_setting("SYNC_INTERVAL"):
+                self._add(
+                    RevokedToken.objects.filter(pk__gt=self._floor)
+                    .order_by("pk")
+                    .values_list("pk", "jti", "revoked_at")
+                )
+                self._synced_at = now
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """Revoke `jti`; return False if it was already revoked."""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        self._sync()
+        with self._lock:
+            self._bloom.add(jti)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._floor, self._recent = 0, set()
+
+
+revocation_store = RevocationStore()
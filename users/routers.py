@@ -0,0 +1,48 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar("replica_reads", default=False)
+# Set by the first write of a request, so its later reads see that write.
+_wrote = ContextVar("wrote", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in this block to a replica, if any are configured.
+
+    Only for read-only paths that tolerate replication lag; everything
+    else, including the login lookup and the rehash write after it, stays on
+    the primary. Once a request has written, its reads stay on the primary
+    too, blocks like this one included.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def forget_writes(**kwargs):
+    """`request_started` receiver: a new request has not written yet."""
+    _wrote.set(False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if _replica_reads.get() and replicas and not _wrote.get():
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
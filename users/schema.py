@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from importlib.metadata import version
+
+from django.conf import settings
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+DEFAULTS = {
+    "DIRECTORY": None,
+}
+
+RENDERERS = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+PACKAGES = ("django", "djangorestframework", "drf-spectacular")
+
+_lock = threading.Lock()
+_fingerprint = None
+_schema = None
+
+
+class ClaimsJWTScheme(SimpleJWTScheme):
+    """Documents `ClaimsJWTAuthentication` as simplejwt's Bearer scheme."""
+
+    target_class = "users.authentication.ClaimsJWTAuthentication"
+
+
+def get_setting(name):
+    return getattr(settings, "SCHEMA_CACHE", {}).get(name, DEFAULTS[name])
+
+
+def directory():
+    return get_setting("DIRECTORY") or os.path.join(settings.BASE_DIR, ".schema")
+
+
+def source_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip hidden directories, caches and virtualenvs.
+        dirnames[:] = sorted(
+            name
+            for name in dirnames
+            if not name.startswith(".")
+            and name != "__pycache__"
+            and not os.path.exists(os.path.join(dirpath, name, "pyvenv.cfg"))
+        )
+        for name in sorted(filenames):
+            if name.endswith(".py"):
+                yield os.path.join(dirpath, name)
+
+
+def code_fingerprint():
+    """Hash of everything the schema is generated from.
+
+    Covers the project's Python sources, the schema settings and the
+    versions of the packages that introspect them; computed once per process.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        for package in PACKAGES:
+            digest.update(f"{package}=={version(package)}\n".encode())
+        digest.update(repr(sorted(settings.SPECTACULAR_SETTINGS.items())).encode())
+        for path in source_files(settings.BASE_DIR):
+            digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class Schema:
+    """The rendered schema in every format, plain and gzipped, with ETags."""
+
+    def __init__(self, fingerprint, content):
+        self.fingerprint = fingerprint
+        self.content = content
+        self.gzipped = {
+            fmt: gzip.compress(body, mtime=0) for fmt, body in content.items()
+        }
+        self.etags = {
+            fmt: hashlib.sha256(body).hexdigest()[:32] for fmt, body in content.items()
+        }
+
+    def etag(self, fmt, gzipped=False):
+        return f'"{self.etags[fmt]}{"-gzip" if gzipped else ""}"'
+
+    def body(self, fmt, gzipped=False):
+        return self.gzipped[fmt] if gzipped else self.content[fmt]
+
+    @classmethod
+    def build(cls):
+        generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+        data = generator.get_schema(request=None, public=True)
+        content = {
+            fmt: renderer().render(data, renderer_context={})
+            for fmt, renderer in RENDERERS.items()
+        }
+        return cls(code_fingerprint(), content)
+
+    @classmethod
+    def load(cls, path):
+        """Read the artifacts in `path`, or None if missing or stale."""
+        try:
+            with open(os.path.join(path, "manifest.json")) as f:
+                manifest = json.load(f)
+            if manifest.get("fingerprint") != code_fingerprint():
+                return None
+            content = {}
+            for fmt in RENDERERS:
+                with open(os.path.join(path, f"schema.{fmt}"), "rb") as f:
+                    content[fmt] = f.read()
+        except (OSError, ValueError):
+            return None
+        return cls(manifest["fingerprint"], content)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        files = {f"schema.{fmt}": body for fmt, body in self.content.items()}
+        files["manifest.json"] = json.dumps({"fingerprint": self.fingerprint}).encode()
+        # The manifest goes last, so a crash never leaves a fresh manifest
+        # pointing at old schema files.
+        for name, body in files.items():
+            tmp = os.path.join(path, f".{name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, os.path.join(path, name))
+
+
+def get_schema(rebuild=False):
+    """Return the schema from memory, else from disk, else build and save it."""
+    global _schema
+    if _schema is not None and not rebuild:
+        return _schema
+    with _lock:
+        if _schema is None or rebuild:
+            path = directory()
+            schema = None if rebuild else Schema.load(path)
+            if schema is None:
+                schema = Schema.build()
+                try:
+                    schema.save(path)
+                except OSError:
+                    # A read-only deployment still serves from memory.
+                    pass
+            _schema = schema
+        return _schema
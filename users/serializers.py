@@ -1,10 +1,23 @@
-from django.contrib.auth import authenticate
-from django.contrib.auth.hashers import make_password
-from django.core.mail import send_mail
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 
+from . import hashing
+from .authentication import get_token_state
+from .backends import EmailPasswordBackend
+from .metrics import timed
 from .models import CustomUser
+from .password_reset import reset_password, send_reset_emails
+from .revocation import revocation_store
+from .stats import increment, record_signup, role_key, signups_key
+from .tokens import get_tokens_for_user
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,6 +26,15 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "email", "role", "date_joined"]
 
 
+def email_taken_message():
+    # The message DRF's UniqueValidator would have produced.
+    field = CustomUser._meta.get_field("email")
+    return field.error_messages["unique"] % {
+        "model_name": CustomUser._meta.verbose_name,
+        "field_label": field.verbose_name,
+    }
+
+
 class UserSignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     password_confirmation = serializers.CharField(write_only=True)
@@ -20,6 +42,8 @@ class UserSignupSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ["id", "email", "role", "password", "password_confirmation"]
+        # Uniqueness is enforced by the INSERT itself, see create().
+        extra_kwargs = {"email": {"validators": []}}
 
     def validate(self, data):
 
@@ -29,9 +53,109 @@ class UserSignupSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
 
-        validated_data.pop("password_confirmation")
-        validated_data["password"] = make_password(validated_data["password"])
-        return super().create(validated_data)
+        validated_data["password"] = hashing.make_password(validated_data["password"])
+        return self.insert(validated_data)
+
+    def insert(self, validated_data):
+        """INSERT the user; `validated_data["password"]` is already hashed."""
+        validated_data.pop("password_confirmation", None)
+        try:
+            with transaction.atomic():
+                user = super().create(validated_data)
+                record_signup(user.role)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {"email": [email_taken_message()]}, code="unique"
+            )
+        return user
+
+
+class BatchSignupSerializer(serializers.Serializer):
+    users = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=100
+    )
+
+    def save(self, **kwargs):
+        """Create every valid item in one transaction; return per-item results."""
+        items = self.validated_data["users"]
+        results = [None] * len(items)
+        pending = {}
+        for index, item in enumerate(items):
+            serializer = UserSignupSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {"status": "error", "errors": serializer.errors}
+            elif serializer.validated_data["email"].lower() in pending:
+                results[index] = {
+                    "status": "error",
+                    "errors": {"email": ["Duplicate email in batch."]},
+                }
+            else:
+                pending[serializer.validated_data["email"].lower()] = (
+                    index,
+                    serializer.validated_data,
+                )
+
+        hashes = hashing.make_passwords(
+            [data["password"] for _, data in pending.values()]
+        )
+        try:
+            created = self.insert(pending, hashes, results)
+        except IntegrityError:
+            # A concurrent signup took one of the emails after our check.
+            created = self.insert(pending, hashes, results)
+
+        for index, user in created:
+            results[index] = {
+                "status": "created",
+                "id": user.id,
+                "email": user.email,
+                "role": user.role,
+            }
+        return results
+
+    def insert(self, pending, hashes, results):
+        with transaction.atomic():
+            existing = {
+                email.lower()
+                for email in CustomUser.objects.filter(
+                    email__lower__in=pending
+                ).values_list("email", flat=True)
+            }
+            created = []
+            for (key, (index, data)), hashed in zip(pending.items(), hashes):
+                if key in existing:
+                    results[index] = {
+                        "status": "error",
+                        "errors": {"email": [email_taken_message()]},
+                    }
+                else:
+                    user = CustomUser(
+                        email=data["email"], role=data["role"], password=hashed
+                    )
+                    created.append((index, user))
+
+            CustomUser.objects.bulk_create([user for _, user in created])
+            deltas = Counter(role_key(user.role) for _, user in created)
+            deltas[signups_key(timezone.localdate())] = len(created)
+            increment(deltas)
+        return created
+
+
+class ImportErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    email = serializers.CharField(allow_null=True)
+    error = serializers.CharField()
+
+
+class ImportResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    errors = serializers.IntegerField()
+    error_report = ImportErrorSerializer(many=True)
+
+
+class UserStatsSerializer(serializers.Serializer):
+    roles = serializers.DictField(child=serializers.IntegerField())
+    signups = serializers.DictField(child=serializers.IntegerField())
 
 
 class UserLoginSerializer(serializers.Serializer):
@@ -44,24 +168,45 @@ class UserLoginSerializer(serializers.Serializer):
         password = data.get("password", None)
 
         if email and password:
-            user = authenticate(email=email, password=password)
-            if user is None:
-                raise serializers.ValidationError("Invalid email or password.")
-            if not user.is_active:
-                raise serializers.ValidationError("This account is inactive.")
-
-            data["user"] = user
+            user = EmailPasswordBackend().authenticate(
+                self.context.get("request"), email=email, password=password
+            )
+            data["user"] = self.check_user(user)
         else:
             raise serializers.ValidationError("Both email and password are required.")
 
         return data
 
+    def check_user(self, user):
+        if user is None:
+            raise serializers.ValidationError("Invalid email or password.")
+        if not user.is_active:
+            raise serializers.ValidationError("This account is inactive.")
+        return user
+
+    async def ais_valid(self):
+        """`is_valid()` for async views, authenticating without blocking.
+
+        Fields are validated as usual; the password is checked with
+        `EmailPasswordBackend.aauthenticate`, which hashes on the process pool
+        (django's `aauthenticate` would run the sync backends in a thread).
+        """
+        try:
+            data = self.to_internal_value(self.initial_data)
+            user = await EmailPasswordBackend().aauthenticate(
+                None, email=data["email"], password=data["password"]
+            )
+            data["user"] = self.check_user(user)
+        except serializers.ValidationError as exc:
+            self._validated_data = {}
+            self._errors = serializers.as_serializer_error(exc)
+        else:
+            self._validated_data = data
+            self._errors = {}
+        return not self._errors
+
     def get_tokens(self, user):
-        refresh = RefreshToken.for_user(user)
-        return {
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-        }
+        return get_tokens_for_user(user)
 
 
 class PasswordResetRequestSerializer(serializers.Serializer):
@@ -69,29 +214,16 @@ class PasswordResetRequestSerializer(serializers.Serializer):
 
     def validate_email(self, value):
         try:
-            user = CustomUser.objects.get(email=value)
+            self.user = CustomUser.objects.get_by_natural_key(value)
         except CustomUser.DoesNotExist:
             raise serializers.ValidationError("No user is associated with this email.")
         return value
 
     def create(self, validated_data):
-        user = CustomUser.objects.get(email=validated_data["email"])
-
-        token = default_token_generator.make_token(user)
-
-        send_mail(
-            "Password Reset",
-            f"Your password reset token is: {token}\nUse this token to reset your password.",
-            "from@example.com",
-            [user.email],
-            fail_silently=False,
-        )
+        send_reset_emails([self.user])
         return validated_data
 
 
-from django.contrib.auth.tokens import default_token_generator
-
-
 class PasswordChangeSerializer(serializers.Serializer):
     email = serializers.EmailField()
     token = serializers.CharField()
@@ -99,10 +231,6 @@ class PasswordChangeSerializer(serializers.Serializer):
 
     def validate(self, data):
 
-        user = CustomUser.objects.filter(email=data["email"]).first()
-        if user is None or not default_token_generator.check_token(user, data["token"]):
-            raise serializers.ValidationError("Invalid token.")
-
         if len(data["new_password"]) < 8:
             raise serializers.ValidationError(
                 "Password must be at least 8 characters long."
@@ -111,18 +239,78 @@ class PasswordChangeSerializer(serializers.Serializer):
         return data
 
     def save(self, **kwargs):
-
-        email = kwargs.get("email")
-        user = CustomUser.objects.get(email=email)
-        user.set_password(self.validated_data["new_password"])
-        user.save()
+        # The token is checked and used up together with the update.
+        if not reset_password(
+            self.validated_data["email"],
+            self.validated_data["token"],
+            self.validated_data["new_password"],
+        ):
+            raise serializers.ValidationError(
+                {serializers.api_settings.NON_FIELD_ERRORS_KEY: ["Invalid token."]}
+            )
 
 
 class SocialSignupSerializer(serializers.Serializer):
     provider = serializers.ChoiceField(choices=["google", "facebook"])
-    access_token = serializers.CharField()
+    access_token = serializers.CharField(required=False)
+    id_token = serializers.CharField(
+        required=False, help_text="A Google ID token, instead of access_token."
+    )
 
+    def validate(self, data):
+        if ("access_token" in data) == ("id_token" in data):
+            raise serializers.ValidationError(
+                "Provide either access_token or id_token."
+            )
+        if "id_token" in data and data["provider"] != "google":
+            raise serializers.ValidationError("id_token is only supported for google.")
+        return data
 
-class SocialLoginSerializer(serializers.Serializer):
-    provider = serializers.ChoiceField(choices=["google", "facebook"])
-    access_token = serializers.CharField()
+
+class SocialLoginSerializer(SocialSignupSerializer):
+    pass
+
+
+class RefreshSerializer(TokenRefreshSerializer):
+    """Refresh with rotation, revoking the old refresh token in `revocation_store`."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        jti = refresh[api_settings.JTI_CLAIM]
+
+        if revocation_store.is_revoked(jti):
+            raise TokenError("Token is blacklisted")
+        if "ver" in refresh:
+            version, is_active = get_token_state(refresh[api_settings.USER_ID_CLAIM])
+            if not is_active or refresh["ver"] != version:
+                raise TokenError("Token has been revoked")
+
+        with timed("jwt_sign"):
+            data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and not revocation_store.revoke(
+                jti, datetime_from_epoch(refresh["exp"])
+            ):
+                # Another request rotated this token first.
+                raise TokenError("Token is blacklisted")
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            with timed("jwt_sign"):
+                data["refresh"] = str(refresh)
+
+        return data
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        revocation_store.revoke(
+            refresh[api_settings.JTI_CLAIM], datetime_from_epoch(refresh["exp"])
+        )
+        return {}
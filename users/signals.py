@@ -0,0 +1,54 @@
+from collections import Counter
+
+from django.contrib.auth.models import Group, Permission, update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .activity import activity_tracker
+from .authentication import remember_token_state
+from .models import CustomUser
+from .permissions import role_permissions
+from .routers import forget_writes
+from .stats import increment, role_key, signups_key
+
+
+request_started.connect(forget_writes, dispatch_uid="users.routers.forget_writes")
+
+
+@receiver(post_save, sender=CustomUser)
+def update_token_state(sender, instance, **kwargs):
+    remember_token_state(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+def uncount_user(sender, instance, **kwargs):
+    # Runs in the deleting transaction; mirrors what rebuild_user_stats counts.
+    deltas = Counter({signups_key(timezone.localdate(instance.date_joined)): -1})
+    if instance.is_active:
+        deltas[role_key(instance.role)] -= 1
+    increment(deltas)
+
+
+# Session logins (the admin) go through the activity buffer as well,
+# instead of django.contrib.auth saving the user on every login.
+user_logged_in.disconnect(update_last_login, dispatch_uid="update_last_login")
+
+
+@receiver(user_logged_in)
+def record_login(sender, user, **kwargs):
+    activity_tracker.record_login(user)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_role_permissions(sender, action="post", **kwargs):
+    if action.startswith("pre_"):
+        return
+    # Other connections only see the change once it commits.
+    transaction.on_commit(role_permissions.invalidate)
@@ -0,0 +1,88 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+from social_django.models import UserSocialAuth
+
+from .jwks import verify_google_id_token
+from .models import CustomUser
+from .providers import ProviderError, provider_client
+from .stats import record_signup
+
+# Our provider names -> social_django's, so accounts linked through the
+# /auth/ flow and through the API share the (provider, uid) rows.
+BACKENDS = {"google": "google-oauth2", "facebook": "facebook"}
+# Profile field holding the provider's stable user id.
+UID_FIELDS = {"google": "sub", "facebook": "id"}
+
+
+def get_user_data(provider, access_token=None, id_token=None):
+    """The provider's profile for the credentials, or None if rejected.
+
+    A Google ID token is verified locally; an access token is exchanged at
+    the provider's userinfo endpoint.
+    """
+    if id_token is not None:
+        return verify_google_id_token(id_token)
+    return provider_client.get_user_data(provider, access_token)
+
+
+def social_uid(provider, user_data):
+    return str(user_data.get(UID_FIELDS[provider]) or "")
+
+
+def email_verified(user_data):
+    """Whether the provider vouches for the profile's email.
+
+    Google's userinfo reports it as `email_verified`; a profile without it,
+    such as Facebook's, does not prove ownership of the address.
+    """
+    return user_data.get("email_verified") is True
+
+
+def get_or_create_social_user(provider, user_data):
+    """The user behind a provider profile, linking the account when new.
+
+    Returning users resolve with one query on the unique (provider, uid)
+    index of social_django's UserSocialAuth. Otherwise the user is found or
+    created by email, and the account linked to it, in one transaction. An
+    existing user is only linked to if the provider verified the email;
+    ProviderError is raised otherwise.
+    """
+    uid = social_uid(provider, user_data)
+    if uid:
+        account = UserSocialAuth.get_social_auth(BACKENDS[provider], uid)
+        if account is not None:
+            return account.user
+    with transaction.atomic():
+        email = user_data.get("email")
+        user, created = CustomUser.objects.get_or_create(
+            email__lower=Lower(Value(email)), defaults={"email": email}
+        )
+        if created:
+            record_signup(user.role)
+        elif not email_verified(user_data):
+            raise ProviderError(
+                f"The {provider} account's email is not verified; "
+                "sign in with your password instead."
+            )
+        if uid:
+            UserSocialAuth.objects.get_or_create(
+                provider=BACKENDS[provider], uid=uid, defaults={"user": user}
+            )
+    return user
+
+
+async def aget_or_create_social_user(provider, user_data):
+    # Returning users, the common case, cost one query on the event loop;
+    # creation keeps the transaction of get_or_create_social_user().
+    uid = social_uid(provider, user_data)
+    if uid:
+        account = (
+            await UserSocialAuth.objects.select_related("user")
+            .filter(provider=BACKENDS[provider], uid=uid)
+            .afirst()
+        )
+        if account is not None:
+            return account.user
+    return await sync_to_async(get_or_create_social_user)(provider, user_data)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import ROLE_CHOICES, StatCounter
+
+UNASSIGNED = "unassigned"
+
+
+def role_key(role):
+    return f"role:{role or UNASSIGNED}"
+
+
+def signups_key(day):
+    return f"signups:{day.isoformat()}"
+
+
+def increment(deltas):
+    """Apply `{counter name: delta}` in one UPDATE, creating missing counters.
+
+    Call inside the transaction that made the change being counted.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    def apply(names):
+        return StatCounter.objects.filter(name__in=names).update(
+            value=F("value")
+            + Case(*(When(name=name, then=Value(deltas[name])) for name in names))
+        )
+
+    if apply(list(deltas)) < len(deltas):
+        existing = set(
+            StatCounter.objects.filter(name__in=deltas).values_list("name", flat=True)
+        )
+        missing = [name for name in deltas if name not in existing]
+        StatCounter.objects.bulk_create(
+            [StatCounter(name=name) for name in missing], ignore_conflicts=True
+        )
+        apply(missing)
+
+
+def record_signup(role, day=None):
+    day = day or timezone.localdate()
+    increment({role_key(role): 1, signups_key(day): 1})
+
+
+def role_counts():
+    roles = [value for value, _ in ROLE_CHOICES] + [UNASSIGNED]
+    values = dict(
+        StatCounter.objects.filter(name__in=[role_key(r) for r in roles]).values_list(
+            "name", "value"
+        )
+    )
+    return {role: values.get(role_key(role), 0) for role in roles}
+
+
+def daily_signups(days):
+    today = timezone.localdate()
+    keys = [signups_key(today - timedelta(days=offset)) for offset in range(days)]
+    values = dict(
+        StatCounter.objects.filter(name__in=keys).values_list("name", "value")
+    )
+    return {key.split(":", 1)[1]: values.get(key, 0) for key in reversed(keys)}
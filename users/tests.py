@@ -1,3 +1,1678 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from asgiref.sync import async_to_sync
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, JsonResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from social_django.models import UserSocialAuth
+
+from . import hashing, idempotency, jwks, metrics, schema, urls
+from .activity import ActivityTracker, activity_tracker
+from .admin import change_role, deactivate_users
+from .authentication import (
+    ClaimsJWTAuthentication,
+    ClaimsUser,
+    get_token_state,
+    token_versions,
+)
+from .backends import EmailPasswordBackend, dummy_password_hash
+from .bench.seed import seed_users
+from .concurrency import limit_concurrency, limiters
+from .exporter import UserExporter
+from .importer import UserImporter
+from .middleware import (
+    AuthenticationMiddleware,
+    CsrfViewMiddleware,
+    MessageMiddleware,
+    SessionMiddleware,
+    XFrameOptionsMiddleware,
+)
+from .models import CustomUser, EmailOutbox, RevokedToken
+from .outbox import claim, drain, enqueue_mails
+from .pagination import KeysetPagination
+from .permissions import RolePermissionMap, role_permissions
+from .providers import (
+    AsyncProviderClient,
+    CircuitBreaker,
+    ProviderUnavailable,
+    async_provider_client,
+    provider_client,
+)
+from .password_reset import make_tokens, reset_password
+from .revocation import RevocationStore, revocation_store
+from .routers import ReplicaRouter, forget_writes, replica_reads
+from .serializers import email_taken_message
+from .stats import daily_signups, role_counts
+from .throttling import IPTokenBucketThrottle, TokenBucketThrottle
+from .tokens import get_tokens_for_user
+from .views import AsyncUserSignupView, BulkUserImportView
+from .warmup import warm_up
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+class RefusingEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError(111, "Connection refused")
+
+    def send_messages(self, messages):
+        raise AssertionError("send_messages() called without a connection")
+
+
+class OutboxDrainTests(TestCase):
+    def setUp(self):
+        enqueue_mails(
+            ("Subject", "Body", "noreply@example.com", f"user{i}@example.com")
+            for i in range(3)
+        )
+
+    def test_sends_due_messages(self):
+        self.assertEqual(drain(), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 3)
+
+    def test_connection_failure_backs_off_every_message(self):
+        self.assertEqual(drain(connection=RefusingEmailBackend()), (0, 3))
+        for item in EmailOutbox.objects.all():
+            self.assertEqual(item.status, EmailOutbox.PENDING)
+            self.assertEqual(item.attempts, 1)
+            self.assertIn("Connection refused", item.last_error)
+            self.assertGreater(item.next_attempt_at, timezone.now())
+        # Backed off, so nothing is due for the next run.
+        self.assertEqual(drain(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_connection_failure_gives_up_after_max_attempts(self):
+        with self.settings(EMAIL_OUTBOX={"MAX_ATTEMPTS": 1}):
+            drain(connection=RefusingEmailBackend())
+        self.assertEqual(
+            EmailOutbox.objects.filter(status=EmailOutbox.FAILED).count(), 3
+        )
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        self.assertEqual(len(claim(2)), 2)
+        self.assertEqual(len(claim(10)), 1)
+        self.assertEqual(claim(10), [])
+
+
+def racing_signup(email):
+    """Stands in for `make_passwords`; signs up `email` while passwords hash."""
+
+    def make_passwords(passwords):
+        CustomUser.objects.create(email=email, role="agent")
+        return [hashers.make_password(password) for password in passwords]
+
+    return make_passwords
+
+
+class ThrottledView:
+    def __init__(self, scope):
+        self.throttle_scope = scope
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class TokenBucketThrottleTests(TestCase):
+    rates = {
+        "login_ip": "3/min",
+        "login_email": "2/min",
+        "password_reset_ip": "3/min",
+        "password_reset_email": "3/hour",
+    }
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(TokenBucketThrottle, "THROTTLE_RATES", self.rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(TokenBucketThrottle, "timer", return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = Request(APIRequestFactory().post("/"))
+
+    def allowed(self, scope="login"):
+        return IPTokenBucketThrottle().allow_request(self.request, ThrottledView(scope))
+
+    def test_allows_a_burst_of_the_full_rate(self):
+        self.assertEqual([self.allowed() for _ in range(4)], [True] * 3 + [False])
+
+    def test_refills_one_request_per_emission_interval(self):
+        for _ in range(3):
+            self.allowed()
+        self.clock.return_value += 19.9
+        self.assertFalse(self.allowed())
+        self.clock.return_value += 0.1
+        self.assertTrue(self.allowed())
+        self.assertFalse(self.allowed())
+
+    def test_scopes_have_separate_buckets(self):
+        for _ in range(3):
+            self.allowed("login")
+        self.assertFalse(self.allowed("login"))
+        self.assertTrue(self.allowed("password_reset"))
+
+    def test_rejection_is_a_429_with_retry_after(self):
+        def login():
+            return self.client.post(
+                reverse("user-login"),
+                {"email": "nobody@example.com", "password": "wrong"},
+                content_type="application/json",
+            )
+
+        self.assertEqual([login().status_code for _ in range(2)], [400, 400])
+        self.clock.return_value += 10
+        response = login()
+        self.assertEqual(response.status_code, 429)
+        # A token comes back 30s after the first request.
+        self.assertEqual(response["Retry-After"], "20")
+
+
+class ConcurrencyLimitTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().post("/")
+
+    def limited(self, view):
+        self.addCleanup(limiters.pop, "test-route", None)
+        return limit_concurrency("test-route", view, initial_limit=1, max_queue=0)
+
+    def assert_shed(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_requests_beyond_the_limit_are_shed(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def slow(request):
+            entered.set()
+            release.wait(5)
+            return HttpResponse()
+
+        view = self.limited(slow)
+        first = threading.Thread(target=view, args=[self.request])
+        first.start()
+        entered.wait(5)
+        self.assert_shed(view(self.request))
+        release.set()
+        first.join()
+        self.assertEqual(view(self.request).status_code, 200)
+
+    def test_slot_is_released_when_the_view_raises(self):
+        def failing(request):
+            raise RuntimeError("boom")
+
+        view = self.limited(failing)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                view(self.request)
+        self.assertEqual(view.limiter.stats()["in_flight"], 0)
+
+    def test_async_requests_beyond_the_limit_are_shed(self):
+        async def run():
+            release = asyncio.Event()
+
+            async def slow(request):
+                await release.wait()
+                return HttpResponse()
+
+            view = self.limited(slow)
+            first = asyncio.ensure_future(view(self.request))
+            await asyncio.sleep(0)
+            self.assert_shed(await view(self.request))
+            release.set()
+            self.assertEqual((await first).status_code, 200)
+            self.assertEqual((await view(self.request)).status_code, 200)
+
+        async_to_sync(run)()
+
+    def test_async_slot_is_released_when_the_view_raises(self):
+        async def failing(request):
+            raise RuntimeError("boom")
+
+        view = self.limited(failing)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                async_to_sync(view)(self.request)
+        self.assertEqual(view.limiter.stats()["in_flight"], 0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class UserImporterTests(TestCase):
+    def test_rows_lost_to_a_concurrent_signup_are_reported(self):
+        errors = []
+        importer = UserImporter(
+            on_error=lambda line, email, message: errors.append((email, message))
+        )
+        rows = [
+            (1, {"email": "first@example.com", "role": "coach"}),
+            (2, {"email": "Taken@example.com", "role": "coach"}),
+            (3, {"email": "third@example.com", "role": "coach"}),
+        ]
+        with mock.patch.object(
+            hashing, "make_passwords", racing_signup("taken@example.com")
+        ):
+            importer.import_batch(rows)
+
+        self.assertEqual(importer.created, 2)
+        self.assertEqual(errors, [("Taken@example.com", "Email already registered.")])
+        self.assertEqual(role_counts()["coach"], 2)
+        self.assertEqual(sum(daily_signups(1).values()), 2)
+        self.assertEqual(
+            CustomUser.objects.get(email="taken@example.com").role, "agent"
+        )
+
+    @override_settings(PASSWORD_HASHING={"USE_POOL": False})
+    def test_upload_that_is_not_utf8_rejects_its_rows(self):
+        admin = CustomUser.objects.create_superuser(
+            email="root@example.com", password="password"
+        )
+        body = (
+            b"email,role,password\n"
+            b"first@example.com,coach,secret\n"
+            b"second@example.com,coach,s\xe9cret\n"
+        )
+        request = APIRequestFactory().post("/", body, content_type="text/csv")
+        force_authenticate(request, admin)
+        response = BulkUserImportView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(
+            response.data["error_report"],
+            [
+                {
+                    "line": 3,
+                    "email": "second@example.com",
+                    "error": "Row is not valid UTF-8.",
+                }
+            ],
+        )
+        self.assertFalse(CustomUser.objects.filter(email="second@example.com").exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class HashingPoolTests(TestCase):
+    def tearDown(self):
+        hashing.shutdown()
+
+    def test_pool_is_rebuilt_after_a_worker_dies(self):
+        pool, _ = hashing.get_pool()
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        encoded = hashing.make_password("secret")
+        self.assertTrue(hashers.check_password("secret", encoded))
+        self.assertIsNot(hashing.get_pool()[0], pool)
+
+    @override_settings(PASSWORD_HASHING={"WORKERS": 1, "MAX_PENDING": 1})
+    def test_failed_submit_frees_its_slot(self):
+        hashing.shutdown()
+        pool, slots = hashing.get_pool()
+        pool.shutdown()  # submit() raises from now on
+        with self.assertRaises(RuntimeError):
+            hashing.make_password("secret")
+        self.assertTrue(slots.acquire(blocking=False))
+
+
+class KeysetPaginationTests(TestCase):
+    def paginate(self, cursor=None, page_size=2):
+        query = {"page_size": page_size}
+        if cursor is not None:
+            query["cursor"] = cursor
+        request = Request(APIRequestFactory().get("/api/users/", query))
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(CustomUser.objects.all(), request)
+        return paginator, rows
+
+    def encode(self, value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+    def test_next_cursor_continues_after_the_last_row(self):
+        for i in range(3):
+            CustomUser.objects.create(email=f"user{i}@example.com", role="coach")
+        paginator, first = self.paginate()
+        cursor = paginator.encode_cursor(paginator.next_position)
+        _, second = self.paginate(cursor)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertNotIn(second[0], first)
+
+    def test_malformed_cursors_are_rejected(self):
+        joined = timezone.now().isoformat()
+        cursors = [
+            "not base64!",
+            self.encode({"role": "coach", "date_joined": joined, "id": 1}),
+            self.encode("coach"),
+            self.encode(["coach", joined]),
+            self.encode(["coach", "yesterday", 1]),
+            self.encode(["coach", joined, {"id": 1}]),
+            self.encode([None, joined, 1]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(NotFound):
+                self.paginate(cursor)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SeedUsersTests(TestCase):
+    def test_reseeding_counts_only_new_users(self):
+        self.assertEqual(list(seed_users(3, batch_size=2)), [2, 3])
+        self.assertEqual(list(seed_users(4, batch_size=2)), [0, 1])
+
+        self.assertEqual(CustomUser.objects.count(), 4)
+        self.assertEqual(sum(role_counts().values()), 4)
+        self.assertEqual(sum(daily_signups(1).values()), 4)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ResetPasswordTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            "reset@example.com", "coach", "old-password"
+        )
+        (self.token,) = make_tokens([self.user])
+
+    def test_resets_once_per_token(self):
+        version = self.user.token_version
+        self.assertTrue(reset_password("Reset@example.com", self.token, "new-password"))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("new-password"))
+        self.assertEqual(self.user.token_version, version + 1)
+        self.assertFalse(reset_password("reset@example.com", self.token, "again"))
+
+    def test_invalid_token_does_not_hash(self):
+        with mock.patch.object(hashing, "make_password") as make_password:
+            self.assertFalse(reset_password("reset@example.com", "wrong", "new"))
+        make_password.assert_not_called()
+
+    def test_hashes_outside_the_transaction(self):
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def make_password(password):
+            depths.append(len(connection.atomic_blocks))
+            return hashers.make_password(password)
+
+        with mock.patch.object(hashing, "make_password", make_password):
+            self.assertTrue(reset_password("reset@example.com", self.token, "new"))
+        self.assertEqual(depths, [depth])
+
+
+def generate_signing_key(kid):
+    """A fresh RSA key and its public JWK, as a provider would publish it."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private_key, jwk
+
+
+class FakeJWKSResponse:
+    def __init__(self, keys, headers=None):
+        self.data = {"keys": keys}
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class MaxAgeTests(TestCase):
+    def test_cache_control(self):
+        self.assertEqual(jwks.max_age({"Cache-Control": "public, max-age=600"}), 600)
+        self.assertEqual(
+            jwks.max_age({"Cache-Control": "max-age=600", "Age": "100"}), 500
+        )
+        self.assertEqual(jwks.max_age({"Cache-Control": "max-age=60", "Age": "90"}), 0)
+        self.assertEqual(jwks.max_age({"Cache-Control": "no-store"}), 0)
+        self.assertIsNone(jwks.max_age({}))
+
+
+@override_settings(
+    GOOGLE_ID_TOKEN={"DEFAULT_MAX_AGE": 3600, "MIN_REFRESH_INTERVAL": 30}
+)
+class JWKSCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.old_key, cls.old_jwk = generate_signing_key("old")
+        cls.new_key, cls.new_jwk = generate_signing_key("new")
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        self.cache = jwks.JWKSCache("https://keys.test/certs", clock=lambda: self.now)
+
+    def serve(self, *responses):
+        return mock.patch("requests.get", side_effect=list(responses))
+
+    def test_keys_are_cached_for_max_age(self):
+        response = FakeJWKSResponse([self.old_jwk], {"Cache-Control": "max-age=1000"})
+        with self.serve(response) as get:
+            self.assertEqual(self.cache.get_key("old").key_id, "old")
+            self.now += 700
+            self.assertEqual(self.cache.get_key("old").key_id, "old")
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(self.cache.refresh_at, 1_000_000.0 + 800)
+
+    def test_default_max_age_without_cache_control(self):
+        with self.serve(FakeJWKSResponse([self.old_jwk])):
+            self.cache.get_key("old")
+        self.assertEqual(self.cache.refresh_at, 1_000_000.0 + 3600 * 0.8)
+
+    def test_refreshes_in_the_background_once_stale(self):
+        with self.serve(
+            FakeJWKSResponse([self.old_jwk], {"Cache-Control": "max-age=100"}),
+            FakeJWKSResponse(
+                [self.old_jwk, self.new_jwk], {"Cache-Control": "max-age=100"}
+            ),
+        ) as get:
+            self.cache.get_key("old")
+            self.now += 90
+            # Served from the cache while the refresh runs.
+            self.assertEqual(self.cache.get_key("old").key_id, "old")
+            for thread in threading.enumerate():
+                if thread.name == "jwks-refresh":
+                    thread.join()
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(set(self.cache.keys), {"old", "new"})
+
+    def test_failed_refresh_keeps_the_cached_keys(self):
+        with self.serve(FakeJWKSResponse([self.old_jwk])):
+            self.cache.get_key("old")
+        with mock.patch("requests.get", side_effect=ValueError("bad json")):
+            with self.assertLogs("users.jwks", "WARNING"):
+                self.cache.refresh()
+        self.assertEqual(set(self.cache.keys), {"old"})
+
+    def test_nothing_cached_and_endpoint_down(self):
+        with mock.patch("requests.get", side_effect=ValueError("bad json")):
+            with self.assertRaises(ProviderUnavailable):
+                self.cache.get_key("old")
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        with self.serve(
+            FakeJWKSResponse([self.old_jwk]),
+            FakeJWKSResponse([self.old_jwk]),
+            FakeJWKSResponse([self.old_jwk, self.new_jwk]),
+        ) as get:
+            self.cache.get_key("old")
+            self.now += 31
+            self.assertIsNone(self.cache.get_key("new"))
+            self.now += 10
+            # Within MIN_REFRESH_INTERVAL of the last fetch: no new request.
+            self.assertIsNone(self.cache.get_key("new"))
+            self.assertEqual(get.call_count, 2)
+            self.now += 30
+            # Rotated in meanwhile.
+            self.assertEqual(self.cache.get_key("new").key_id, "new")
+        self.assertEqual(get.call_count, 3)
+
+    def test_saved_keys_are_used_by_the_next_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "keys.json")
+            cache = jwks.JWKSCache(self.cache.url, path, clock=lambda: self.now)
+            with self.serve(FakeJWKSResponse([self.old_jwk])):
+                cache.get_key("old")
+            restarted = jwks.JWKSCache(self.cache.url, path, clock=lambda: self.now)
+            with mock.patch("requests.get") as get:
+                self.assertEqual(restarted.get_key("old").key_id, "old")
+            get.assert_not_called()
+
+
+class VerifyGoogleIdTokenTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signing_key, cls.jwk = generate_signing_key("google-1")
+        cls.other_key, _ = generate_signing_key("google-1")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            GOOGLE_ID_TOKEN={
+                "JWKS_URL": "https://keys.test/oauth2/v3/certs",
+                "AUDIENCES": ["client-id.apps.googleusercontent.com"],
+                "CACHE_DIRECTORY": directory.name,
+                "MIN_REFRESH_INTERVAL": 0,
+                "LEEWAY": 30,
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(jwks._caches.clear)
+        get = mock.patch("requests.get", return_value=FakeJWKSResponse([self.jwk]))
+        self.get = get.start()
+        self.addCleanup(get.stop)
+
+    def make_token(self, key=None, kid="google-1", **claims):
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": "client-id.apps.googleusercontent.com",
+            "sub": "1234567890",
+            "email": "player@example.com",
+            "email_verified": True,
+            "iat": now,
+            "exp": now + 3600,
+            **claims,
+        }
+        return jwt.encode(
+            payload, key or self.signing_key, algorithm="RS256", headers={"kid": kid}
+        )
+
+    def test_valid_token(self):
+        claims = jwks.verify_google_id_token(self.make_token())
+        self.assertEqual(claims["email"], "player@example.com")
+        claims = jwks.verify_google_id_token(self.make_token(iss="accounts.google.com"))
+        self.assertEqual(claims["sub"], "1234567890")
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_rejected_tokens(self):
+        now = int(time.time())
+        tokens = {
+            "bad aud": self.make_token(aud="someone-else.apps.googleusercontent.com"),
+            "bad iss": self.make_token(iss="https://evil.example.com"),
+            "expired": self.make_token(iat=now - 7200, exp=now - 3600),
+            "unverified email": self.make_token(email_verified=False),
+            "missing email_verified": self.make_token(email_verified=None),
+            "wrong signature": self.make_token(key=self.other_key),
+            "not a jwt": "not-a-token",
+        }
+        for name, token in tokens.items():
+            with self.subTest(name):
+                self.assertIsNone(jwks.verify_google_id_token(token))
+
+    def test_unknown_kid(self):
+        token = self.make_token(kid="rotated-away")
+        self.assertIsNone(jwks.verify_google_id_token(token))
+        # The initial fetch and one refetch for the unknown key.
+        self.assertEqual(self.get.call_count, 2)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(3, 30.0, clock=lambda: self.now)
+
+    def open_circuit(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+        # The success reset the count, so two more failures are not enough.
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_a_single_probe_through(self):
+        self.open_circuit()
+        self.now = 29.9
+        self.assertFalse(self.breaker.allow())
+
+        self.now = 30.0
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.open_circuit()
+        self.now = 30.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens_for_another_period(self):
+        self.open_circuit()
+        self.now = 30.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now = 59.9
+        self.assertFalse(self.breaker.allow())
+        self.now = 60.0
+        self.assertTrue(self.breaker.allow())
+
+
+class AsyncProviderClientTests(TestCase):
+    def setUp(self):
+        self.client = AsyncProviderClient()
+
+    async def get_clients(self, *providers):
+        return [(await self.client._get(provider))[0] for provider in providers]
+
+    def test_reuses_a_client_within_a_loop(self):
+        first, again, other = asyncio.run(
+            self.get_clients("google", "google", "facebook")
+        )
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+    def test_closes_clients_when_their_loop_shuts_down(self):
+        runs = {
+            "asyncio.run": lambda: asyncio.run(self.get_clients("google", "facebook")),
+            "async_to_sync": lambda: async_to_sync(self.get_clients)(
+                "google", "facebook"
+            ),
+        }
+        for name, run in runs.items():
+            with self.subTest(name):
+                google, facebook = run()
+                self.assertTrue(google.is_closed)
+                self.assertTrue(facebook.is_closed)
+                self.assertEqual(len(self.client._clients), 0)
+
+    def test_a_new_loop_gets_a_new_client(self):
+        [first] = asyncio.run(self.get_clients("google"))
+        [second] = asyncio.run(self.get_clients("google"))
+        self.assertIsNot(first, second)
+
+    def test_aclose_closes_the_running_loops_clients(self):
+        async def get_and_close():
+            [client] = await self.get_clients("google")
+            await self.client.aclose()
+            return client.is_closed, len(self.client._clients)
+
+        self.assertEqual(asyncio.run(get_and_close()), (True, 0))
+
+    def test_breakers_outlive_loops(self):
+        async def get_breaker():
+            return (await self.client._get("google"))[1]
+
+        self.assertIs(asyncio.run(get_breaker()), asyncio.run(get_breaker()))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class StatCounterTests(TestCase):
+    def assert_counts_match_users(self):
+        active = CustomUser.objects.filter(is_active=True)
+        self.assertEqual(
+            {role: count for role, count in role_counts().items() if count},
+            dict(Counter(active.values_list("role", flat=True))),
+        )
+        self.assertEqual(sum(daily_signups(1).values()), CustomUser.objects.count())
+
+    def signup(self, email, role):
+        response = self.client.post(
+            reverse("user-signup"),
+            {
+                "email": email,
+                "role": role,
+                "password": "Secret-password-1",
+                "password_confirmation": "Secret-password-1",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return CustomUser.objects.get(pk=response.json()["id"])
+
+    def test_signup_role_change_and_delete(self):
+        coach = self.signup("coach@example.com", "coach")
+        agent = self.signup("agent@example.com", "agent")
+        self.assert_counts_match_users()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            change_role([coach.pk], "football_player")
+        self.assert_counts_match_users()
+
+        agent.delete()
+        self.assert_counts_match_users()
+        self.assertEqual(role_counts()["agent"], 0)
+
+    def test_deleting_an_inactive_user_keeps_role_counts(self):
+        coach = self.signup("coach@example.com", "coach")
+        with self.captureOnCommitCallbacks(execute=True):
+            deactivate_users([coach.pk])
+        CustomUser.objects.filter(pk=coach.pk).delete()
+        self.assert_counts_match_users()
+        self.assertEqual(role_counts()["coach"], 0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class SignupTests(TestCase):
+    def user(self, email, role="coach"):
+        return {
+            "email": email,
+            "role": role,
+            "password": "Secret-password-1",
+            "password_confirmation": "Secret-password-1",
+        }
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), data, content_type="application/json")
+
+    def test_case_variant_of_a_registered_email_is_a_400(self):
+        self.assertEqual(
+            self.post("user-signup", self.user("coach@example.com")).status_code, 201
+        )
+        response = self.post("user-signup", self.user("Coach@example.com"))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"email": [email_taken_message()]})
+        self.assertEqual(CustomUser.objects.count(), 1)
+        self.assertEqual(role_counts()["coach"], 1)
+
+    def test_batch_reports_duplicates_per_item(self):
+        CustomUser.objects.create_user("taken@example.com", "agent", "password")
+        response = self.post(
+            "user-signup-batch",
+            {
+                "users": [
+                    self.user("first@example.com"),
+                    self.user("First@example.com"),
+                    self.user("TAKEN@example.com"),
+                    self.user("second@example.com", role="football_player"),
+                ]
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["created"], 2)
+        self.assertEqual(
+            [result["status"] for result in body["results"]],
+            ["created", "error", "error", "created"],
+        )
+        self.assertEqual(
+            body["results"][1]["errors"], {"email": ["Duplicate email in batch."]}
+        )
+        self.assertEqual(
+            body["results"][2]["errors"], {"email": [email_taken_message()]}
+        )
+        self.assertEqual(
+            set(CustomUser.objects.values_list("email", flat=True)),
+            {"first@example.com", "taken@example.com", "second@example.com"},
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class EmailPasswordBackendTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            "Coach@example.com", "coach", "password"
+        )
+        self.backend = EmailPasswordBackend()
+
+    def test_email_matches_in_any_case(self):
+        self.assertEqual(
+            self.backend.authenticate(
+                None, email="COACH@EXAMPLE.COM", password="password"
+            ),
+            self.user,
+        )
+        self.assertEqual(
+            async_to_sync(self.backend.aauthenticate)(
+                None, email="coach@example.com", password="password"
+            ),
+            self.user,
+        )
+        self.assertIsNone(
+            self.backend.authenticate(None, email="coach@example.com", password="x")
+        )
+
+    def test_unknown_email_still_checks_a_password(self):
+        with mock.patch.object(
+            hashing, "verify_password", wraps=hashing.verify_password
+        ) as verify:
+            self.assertIsNone(
+                self.backend.authenticate(
+                    None, email="nobody@example.com", password="password"
+                )
+            )
+        verify.assert_called_once_with("password", dummy_password_hash())
+
+
+class EmailDedupeMigrationTests(TransactionTestCase):
+    before = [("users", "0009_customuser_last_seen")]
+    after = [("users", "0010_customuser_email_ci_unique")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        call_command("migrate", verbosity=0)
+
+    def test_case_duplicates_are_retired_before_the_constraint(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("users", "CustomUser")
+        StatCounter = apps.get_model("users", "StatCounter")
+        old = User.objects.create(email="Player@example.com", role="coach")
+        recent = User.objects.create(
+            email="player@example.com", role="coach", last_login=timezone.now()
+        )
+        StatCounter.objects.create(name="role:coach", value=2)
+
+        apps = self.migrate(self.after)
+        User = apps.get_model("users", "CustomUser")
+        kept, retired = User.objects.get(pk=recent.pk), User.objects.get(pk=old.pk)
+        self.assertTrue(kept.is_active)
+        self.assertEqual(kept.email, "player@example.com")
+        self.assertFalse(retired.is_active)
+        self.assertEqual(retired.email, f"duplicate-{old.pk}-Player@example.com")
+        self.assertEqual(retired.token_version, 1)
+        self.assertEqual(
+            apps.get_model("users", "StatCounter").objects.get(name="role:coach").value,
+            1,
+        )
+        with self.assertRaises(IntegrityError):
+            User.objects.create(email="PLAYER@example.com", role="coach")
+
+
+class SchemaViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        cache_settings = override_settings(SCHEMA_CACHE={"DIRECTORY": self.directory})
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        patcher = mock.patch.object(schema, "_schema", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return self.client.get(reverse("docs"), headers=headers)
+
+    def test_etag_and_conditional_get(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"openapi:", response.content)
+        etag = response["ETag"]
+
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get(if_none_match=f"W/{etag}").status_code, 304)
+        self.assertEqual(self.get(if_none_match='"other"').status_code, 200)
+
+    def test_gzip_variant_has_its_own_etag(self):
+        plain = self.get()
+        gzipped = self.get(accept_encoding="gzip")
+
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertNotEqual(gzipped["ETag"], plain["ETag"])
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(
+            self.get(accept_encoding="gzip", if_none_match=plain["ETag"]).status_code,
+            200,
+        )
+        self.assertEqual(
+            self.get(accept_encoding="gzip", if_none_match=gzipped["ETag"]).status_code,
+            304,
+        )
+
+    def test_prebuilt_schema_is_reused_until_the_code_changes(self):
+        built = schema.get_schema()
+        self.assertEqual(schema.Schema.load(self.directory).content, built.content)
+        with mock.patch.object(schema, "code_fingerprint", return_value="changed"):
+            self.assertIsNone(schema.Schema.load(self.directory))
+
+
+PROFILE = {
+    "sub": "google-1",
+    "email": "social@example.com",
+    "email_verified": True,
+}
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class AuthViewTests(TestCase):
+    """The auth endpoints as served by the sync views."""
+
+    def setUp(self):
+        cache.clear()
+        for patcher in (
+            mock.patch.object(activity_tracker, "record_login"),
+            mock.patch.object(provider_client, "get_user_data", return_value=PROFILE),
+            mock.patch.object(
+                async_provider_client, "get_user_data", return_value=PROFILE
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, name, data, **headers):
+        return self.client.post(
+            reverse(name), data, content_type="application/json", headers=headers
+        )
+
+    def signup(self, email="coach@example.com", **headers):
+        return self.post(
+            "user-signup",
+            {
+                "email": email,
+                "role": "coach",
+                "password": "Secret-password-1",
+                "password_confirmation": "Secret-password-1",
+            },
+            **headers,
+        )
+
+    def social(self, name):
+        return self.post(name, {"provider": "google", "access_token": "token"})
+
+    def test_signup(self):
+        response = self.signup()
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get()
+        self.assertEqual(
+            response.json(), {"id": user.pk, "email": user.email, "role": "coach"}
+        )
+
+        response = self.signup("Coach@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"email": [email_taken_message()]})
+
+    def test_login(self):
+        self.signup()
+        response = self.post(
+            "user-login",
+            {"email": "coach@example.com", "password": "Secret-password-1"},
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["email"], body["role"]), ("coach@example.com", "coach"))
+        self.assertEqual(set(body["tokens"]), {"access", "refresh"})
+
+        response = self.post(
+            "user-login", {"email": "coach@example.com", "password": "wrong"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"non_field_errors": ["Invalid email or password."]}
+        )
+
+    def test_social_signup_then_login(self):
+        response = self.social("social-signup")
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(email="social@example.com")
+        self.assertEqual(
+            response.json(), {"id": user.pk, "email": user.email, "role": ""}
+        )
+
+        response = self.social("social-login")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["id"], body["email"]), (user.pk, user.email))
+        self.assertEqual(set(body["token"]), {"access", "refresh"})
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+    def test_unverified_email_is_not_linked_to_an_existing_user(self):
+        user = CustomUser.objects.create(email="social@example.com")
+        for verified in (False, None):
+            profile = {**PROFILE, "email_verified": verified}
+            provider_client.get_user_data.return_value = profile
+            async_provider_client.get_user_data.return_value = profile
+            for name in ("social-signup", "social-login"):
+                with self.subTest(name, email_verified=verified):
+                    response = self.social(name)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("not verified", response.json()["error"])
+        self.assertFalse(UserSocialAuth.objects.exists())
+
+        provider_client.get_user_data.return_value = PROFILE
+        async_provider_client.get_user_data.return_value = PROFILE
+        response = self.social("social-login")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], user.pk)
+        self.assertEqual(UserSocialAuth.objects.get().user, user)
+
+    def test_unverified_email_still_signs_up_a_new_user(self):
+        profile = {**PROFILE, "email_verified": False}
+        provider_client.get_user_data.return_value = profile
+        async_provider_client.get_user_data.return_value = profile
+
+        response = self.social("social-signup")
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(email="social@example.com")
+        self.assertEqual(UserSocialAuth.objects.get().user, user)
+
+    def test_idempotent_signup_is_replayed(self):
+        first = self.signup(idempotency_key="signup-1")
+        retry = self.signup(idempotency_key="signup-1")
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+
+class AsyncAuthViewTests(AuthViewTests):
+    """The same requests against the async views (`ASYNC_AUTH_VIEWS`)."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Registered first, so it runs after the setting is restored.
+        cls.addClassCleanup(cls.reload_urls)
+        cls.enterClassContext(override_settings(ASYNC_AUTH_VIEWS=True))
+        cls.reload_urls()
+        super().setUpClass()
+
+    @staticmethod
+    def reload_urls():
+        importlib.reload(urls)
+        # The root URLconf holds a resolver built from the old patterns.
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    def post(self, name, data, **headers):
+        return async_to_sync(self.async_client.post)(
+            reverse(name), data, content_type="application/json", headers=headers
+        )
+
+    def test_urls_serve_the_async_views(self):
+        self.assertIs(
+            resolve(reverse("user-signup")).func.__wrapped__.view_class,
+            AsyncUserSignupView,
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class RolePermissionTests(TestCase):
+    def setUp(self):
+        for name in ("touch", "record_login"):
+            patcher = mock.patch.object(activity_tracker, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        role_permissions.invalidate()
+        self.addCleanup(role_permissions.invalidate)
+        self.coaches = Group.objects.create(name="coach")
+
+    def grant(self, group, *codenames):
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(
+                *Permission.objects.filter(
+                    content_type__app_label="users", codename__in=codenames
+                )
+            )
+
+    def test_roles_have_their_groups_permissions(self):
+        self.grant(self.coaches, "view_statcounter", "view_customuser")
+        self.grant(Group.objects.create(name="agent"), "view_customuser")
+        role_permissions.state()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                role_permissions.has_perms(
+                    "coach", ["users.view_statcounter", "users.view_customuser"]
+                )
+            )
+            self.assertTrue(
+                role_permissions.has_perms("agent", ["users.view_customuser"])
+            )
+            self.assertFalse(
+                role_permissions.has_perms("agent", ["users.view_statcounter"])
+            )
+            self.assertFalse(
+                role_permissions.has_perms("coach", ["users.add_customuser"])
+            )
+            self.assertFalse(
+                role_permissions.has_perms(None, ["users.view_customuser"])
+            )
+
+    def test_group_and_permission_changes_rebuild_the_map(self):
+        self.assertFalse(
+            role_permissions.has_perms("coach", ["users.view_statcounter"])
+        )
+        self.grant(self.coaches, "view_statcounter")
+        self.assertTrue(role_permissions.has_perms("coach", ["users.view_statcounter"]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coaches.permissions.clear()
+        self.assertFalse(
+            role_permissions.has_perms("coach", ["users.view_statcounter"])
+        )
+
+        self.grant(self.coaches, "view_statcounter")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coaches.delete()
+        self.assertFalse(
+            role_permissions.has_perms("coach", ["users.view_statcounter"])
+        )
+
+    def test_other_processes_rebuild_when_the_version_moves(self):
+        other = RolePermissionMap(clock=lambda: 1000.0)
+        self.assertFalse(other.has_perms("coach", ["users.view_statcounter"]))
+        with override_settings(ROLE_PERMISSIONS={"SYNC_INTERVAL": 0}):
+            self.grant(self.coaches, "view_statcounter")
+            self.assertTrue(other.has_perms("coach", ["users.view_statcounter"]))
+
+    def test_role_gated_views(self):
+        coach = CustomUser.objects.create_user("coach@example.com", "coach", "pw")
+        access = get_tokens_for_user(coach)["access"]
+        headers = {"authorization": f"Bearer {access}"}
+
+        def statuses():
+            return [
+                self.client.get(reverse("user-stats"), headers=headers).status_code,
+                self.client.get(reverse("user-export"), headers=headers).status_code,
+                self.client.post(
+                    reverse("bulk-import"),
+                    "email,role,password\n",
+                    content_type="text/csv",
+                    headers=headers,
+                ).status_code,
+            ]
+
+        self.assertEqual(statuses(), [403, 403, 403])
+        self.grant(
+            self.coaches, "view_statcounter", "view_customuser", "add_customuser"
+        )
+        self.assertEqual(statuses(), [200, 200, 200])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        for name in ("touch", "record_login"):
+            patcher = mock.patch.object(activity_tracker, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        token_versions.clear()
+        self.user = CustomUser.objects.create_user(
+            "coach@example.com", "coach", "password"
+        )
+        self.access = get_tokens_for_user(self.user)["access"]
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {self.access}"
+        )
+        return ClaimsJWTAuthentication().authenticate(Request(request))
+
+    def assert_revoked(self):
+        with self.assertRaisesMessage(AuthenticationFailed, "revoked"):
+            self.authenticate()
+
+    def test_user_comes_from_the_claims(self):
+        self.authenticate()  # caches the token state
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.email, user.role), ("coach@example.com", "coach"))
+
+    def test_set_password_revokes_tokens(self):
+        self.authenticate()
+        self.user.set_password("new-password")
+        self.user.save()
+        self.assert_revoked()
+
+    def test_role_change_revokes_tokens(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            change_role([self.user.pk], "agent")
+        self.assert_revoked()
+
+    @override_settings(DATABASE_REPLICAS=["replica_0"])
+    def test_token_state_is_read_from_the_primary(self):
+        # A read routed to the (unconfigured) replica would fail to connect.
+        token_versions.clear()
+        forget_writes()
+        state = get_token_state(self.user.pk)
+        self.assertEqual(state, (self.user.token_version, True))
+
+    def test_admin_role_change_revokes_tokens(self):
+        self.authenticate()
+        admin = CustomUser.objects.create_superuser(
+            email="root@example.com", password="password"
+        )
+        self.client.force_login(admin)
+        self.client.post(
+            reverse("admin:users_customuser_change", args=[self.user.pk]),
+            {"email": self.user.email, "role": "agent", "is_active": "on"},
+        )
+        self.assert_revoked()
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0", "replica_1"])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        forget_writes()
+        self.addCleanup(forget_writes)
+
+    def test_reads_use_a_replica_only_when_opted_in(self):
+        self.assertEqual(self.router.db_for_read(CustomUser), "default")
+        with replica_reads():
+            self.assertIn(
+                self.router.db_for_read(CustomUser), {"replica_0", "replica_1"}
+            )
+        self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_use_the_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+    def test_reads_after_a_write_use_the_primary(self):
+        self.assertEqual(self.router.db_for_write(CustomUser), "default")
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+        request_started.send(sender=self.__class__)
+        with replica_reads():
+            self.assertNotEqual(self.router.db_for_read(CustomUser), "default")
+
+    def test_relations_and_migrations(self):
+        user = CustomUser(email="coach@example.com")
+        replica_user = CustomUser(email="agent@example.com")
+        replica_user._state.db = "replica_0"
+        self.assertTrue(self.router.allow_relation(user, replica_user))
+        self.assertTrue(self.router.allow_migrate("default", "users"))
+        self.assertFalse(self.router.allow_migrate("replica_0", "users"))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class RefreshRevocationTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(activity_tracker, "record_login")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        revocation_store.reset()
+        self.addCleanup(revocation_store.reset)
+        user = CustomUser.objects.create_user("coach@example.com", "coach", "pw")
+        self.refresh_token = get_tokens_for_user(user)["refresh"]
+
+    def post(self, name, refresh):
+        return self.client.post(
+            reverse(name), {"refresh": refresh}, content_type="application/json"
+        )
+
+    def test_reusing_a_rotated_refresh_token_fails(self):
+        response = self.post("token-refresh", self.refresh_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()["refresh"], self.refresh_token)
+        self.assertEqual(
+            self.post("token-refresh", self.refresh_token).status_code, 401
+        )
+
+    def test_logout_revokes_the_refresh_token(self):
+        self.assertEqual(self.post("user-logout", self.refresh_token).status_code, 200)
+        self.assertEqual(
+            self.post("token-refresh", self.refresh_token).status_code, 401
+        )
+
+    @override_settings(TOKEN_REVOCATION={"SYNC_INTERVAL": 0})
+    def test_revocation_committed_out_of_pk_order_is_synced(self):
+        expires_at = timezone.now() + timedelta(days=1)
+        store = RevocationStore()
+        RevokedToken.objects.create(pk=2, jti="committed-first", expires_at=expires_at)
+        self.assertTrue(store.is_revoked("committed-first"))
+        # Its transaction began first, so it got the lower pk.
+        RevokedToken.objects.create(pk=1, jti="committed-later", expires_at=expires_at)
+        self.assertTrue(store.is_revoked("committed-later"))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AdminRevocationTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(activity_tracker, "record_login")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = CustomUser.objects.create_superuser(
+            email="root@example.com", password="password"
+        )
+        self.staff = CustomUser.objects.create_user(
+            "staff@example.com", "admin", "password", is_staff=True
+        )
+        self.tokens = get_tokens_for_user(self.staff)
+        self.client.force_login(self.admin)
+
+    def get_stats(self):
+        return self.client.get(
+            reverse("user-stats"),
+            HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}",
+        )
+
+    def refresh(self):
+        return self.client.post(
+            reverse("token-refresh"),
+            {"refresh": self.tokens["refresh"]},
+            content_type="application/json",
+        )
+
+    def assert_revoked(self):
+        self.assertEqual(self.get_stats().status_code, 401)
+        self.assertEqual(self.refresh().status_code, 401)
+
+    def test_removing_staff_status_revokes_tokens(self):
+        self.assertEqual(self.get_stats().status_code, 200)
+        response = self.client.post(
+            reverse("admin:users_customuser_change", args=[self.staff.pk]),
+            {"email": self.staff.email, "role": "admin", "is_active": "on"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.staff.refresh_from_db()
+        self.assertFalse(self.staff.is_staff)
+        self.assert_revoked()
+
+    def test_bulk_deactivation_revokes_tokens_at_once(self):
+        self.assertEqual(self.get_stats().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("admin:users_customuser_changelist"),
+                {"action": "deactivate", "_selected_action": [self.staff.pk]},
+            )
+        self.assert_revoked()
+
+
+class ActivityTrackerTests(TestCase):
+    def setUp(self):
+        self.tracker = ActivityTracker()
+        self.tracker._started = True  # no flusher thread; flush() by hand
+        self.coach = CustomUser.objects.create(email="coach@example.com", role="coach")
+        self.agent = CustomUser.objects.create(email="agent@example.com", role="agent")
+
+    def test_touches_are_written_in_one_update(self):
+        for _ in range(3):
+            self.tracker.touch(self.coach.pk, "coach")
+            self.tracker.touch(self.agent.pk, "agent")
+        self.tracker.record_login(self.coach)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 2)
+        self.coach.refresh_from_db()
+        self.agent.refresh_from_db()
+        self.assertIsNotNone(self.coach.last_login)
+        self.assertIsNotNone(self.coach.last_seen)
+        self.assertIsNone(self.agent.last_login)
+        self.assertIsNotNone(self.agent.last_seen)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tracker.flush(), 0)
+
+    def test_touches_within_the_resolution_are_not_recorded(self):
+        self.tracker.touch(self.coach.pk, "coach")
+        self.tracker.flush()
+        self.tracker.touch(self.coach.pk, "coach")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tracker.flush(), 0)
+
+    def test_timestamps_only_move_forward(self):
+        later = timezone.now().replace(microsecond=0) + timedelta(hours=1)
+        CustomUser.objects.filter(pk=self.coach.pk).update(last_seen=later)
+        self.tracker.touch(self.coach.pk, "coach")
+        self.tracker.flush()
+        self.coach.refresh_from_db()
+        self.assertEqual(self.coach.last_seen, later)
+
+    def test_exit_flush_survives_a_missing_database(self):
+        self.tracker.touch(self.coach.pk, "coach")
+        with mock.patch.object(
+            ActivityTracker, "write", side_effect=OperationalError("no such table")
+        ), self.assertLogs("users.activity", "WARNING"):
+            self.tracker._flush_at_exit()
+        # Kept for a later flush.
+        self.assertEqual(self.tracker.flush(), 1)
+
+
+class MetricsRegistryTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        metrics_settings = override_settings(METRICS={"DIRECTORY": self.directory})
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+
+        self.registry = metrics.Registry()
+        self.registry._started = True  # no flusher thread
+        self.requests = self.registry.counter("requests_total", "Requests.", ("view",))
+        self.latency = self.registry.histogram(
+            "latency_seconds", "Latency.", ("view",), buckets=(0.1, 1.0)
+        )
+        self.in_flight = {("login",): 1}
+        self.registry.gauge(
+            "in_flight", "In flight.", ("view",), lambda: self.in_flight
+        )
+
+    def write_worker(self, pid, requests, in_flight):
+        with open(os.path.join(self.directory, f"{pid}.json"), "w") as f:
+            json.dump(
+                {
+                    "requests_total": [[["login"], requests]],
+                    "latency_seconds": [[["login"], [[1, 0, 0], 0.05]]],
+                    "in_flight": [[["login"], in_flight]],
+                },
+                f,
+            )
+
+    def test_workers_files_are_summed(self):
+        self.requests.inc("login", amount=2)
+        self.latency.observe(0.5, "login")
+        self.write_worker(os.getppid(), requests=3, in_flight=4)
+
+        collected = self.registry.collect()
+        self.assertEqual(collected["requests_total"], {("login",): 5})
+        self.assertEqual(collected["latency_seconds"], {("login",): [[1, 1, 0], 0.55]})
+        self.assertEqual(collected["in_flight"], {("login",): 5})
+        self.assertIn(
+            'latency_seconds_bucket{view="login",le="1.0"} 2', self.registry.render()
+        )
+
+    def test_gauges_of_killed_workers_are_dropped(self):
+        worker = subprocess.Popen([sys.executable, "-c", "pass"])
+        worker.wait()
+        self.write_worker(worker.pid, requests=3, in_flight=4)
+
+        collected = self.registry.collect()
+        # Counters never go backwards; the dead worker's gauge is gone.
+        self.assertEqual(collected["requests_total"], {("login",): 3})
+        self.assertEqual(collected["in_flight"], {("login",): 1})
+
+
+class BrowserOnlyMiddlewareTests(TestCase):
+    def handle(self, path):
+        seen = {}
+
+        def view(request):
+            seen["request"] = request
+            return HttpResponse()
+
+        handler = SessionMiddleware(
+            AuthenticationMiddleware(MessageMiddleware(XFrameOptionsMiddleware(view)))
+        )
+        response = handler(RequestFactory().get(path))
+        return seen["request"], response
+
+    def test_api_requests_skip_the_browser_middleware(self):
+        request, response = self.handle("/api/users/")
+        self.assertFalse(hasattr(request, "session"))
+        self.assertFalse(hasattr(request, "user"))
+        self.assertFalse(hasattr(request, "_messages"))
+        self.assertNotIn("X-Frame-Options", response)
+
+    def test_browser_requests_keep_it(self):
+        request, response = self.handle("/admin/")
+        self.assertTrue(hasattr(request, "session"))
+        self.assertTrue(hasattr(request, "user"))
+        self.assertTrue(hasattr(request, "_messages"))
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+
+    def test_csrf_is_only_checked_outside_the_api(self):
+        def view(request):
+            return HttpResponse()
+
+        middleware = CsrfViewMiddleware(view)
+        for path, expected in (("/api/users/login/", None), ("/admin/login/", 403)):
+            request = RequestFactory().post(path)
+            response = middleware.process_view(request, view, (), {})
+            self.assertEqual(response and response.status_code, expected)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PASSWORD_HASHING={"USE_POOL": False})
+class WarmUpTests(TestCase):
+    def test_failing_step_does_not_stop_the_worker(self):
+        with mock.patch(
+            "users.warmup.get_schema", side_effect=RuntimeError("schema")
+        ), self.assertLogs("users.warmup", "ERROR"):
+            timings = warm_up()
+        self.assertNotIn("schema", timings)
+        self.assertIn("urls", timings)
+
+
+class UserExporterTests(TestCase):
+    def export(self, **kwargs):
+        exporter = UserExporter("ndjson", **kwargs)
+        rows = b"".join(exporter).decode().splitlines()
+        return exporter, [json.loads(row)["email"] for row in rows]
+
+    def join(self, email, joined):
+        user = CustomUser.objects.create(email=email, role="coach")
+        # date_joined is auto_now_add, so it can only be backdated afterwards.
+        CustomUser.objects.filter(pk=user.pk).update(date_joined=joined)
+
+    def test_watermark_trails_commits_in_progress(self):
+        now = timezone.now()
+        self.join("early@example.com", now - timedelta(minutes=1))
+        # Joined just before the export started, committed while it ran.
+        self.join("late@example.com", now - timedelta(seconds=1))
+
+        first, emails = self.export()
+        self.assertLess(first.until, now - timedelta(seconds=4))
+        self.assertEqual(emails, ["early@example.com"])
+
+        _, emails = self.export(since=first.until, until=now + timedelta(seconds=1))
+        self.assertEqual(emails, ["late@example.com"])
+
+
+class AsyncOnlyCache:
+    """A cache that fails if its blocking methods are used."""
+
+    def __init__(self):
+        self.entries = {}
+        self.timeouts = {}
+
+    def __getattr__(self, name):
+        raise AssertionError(f"blocking cache.{name}() called")
+
+    async def aget(self, key):
+        return self.entries.get(key)
+
+    async def aadd(self, key, value, timeout):
+        if key in self.entries:
+            return False
+        self.entries[key] = value
+        return True
+
+    async def aset(self, key, value, timeout):
+        self.entries[key] = value
+        self.timeouts[key] = timeout
+
+    async def adelete(self, key):
+        self.entries.pop(key, None)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def view(self, request):
+        self.calls += 1
+        return JsonResponse({"call": self.calls}, status=201)
+
+    def post(self, view, key="key-1", body=None):
+        request = RequestFactory().post(
+            "/signup/",
+            body or {"email": "a@example.com"},
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+        return view(request)
+
+    def test_retry_replays_the_first_response(self):
+        view = idempotency.idempotent(self.view)
+        first = self.post(view)
+        retry = self.post(view)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(
+            self.post(view, body={"email": "b@example.com"}).status_code, 422
+        )
+
+    def test_token_responses_expire_with_the_access_token(self):
+        with mock.patch.object(cache, "set", wraps=cache.set) as set_:
+            self.post(idempotency.idempotent(self.view))
+            self.post(idempotency.idempotent(self.view, carries_tokens=True), "key-2")
+
+        self.assertEqual(set_.call_args_list[0].kwargs["timeout"], 24 * 3600)
+        self.assertEqual(set_.call_args_list[1].kwargs["timeout"], 30 * 60)
+
+    def test_async_views_use_the_async_cache_api(self):
+        async def view(request):
+            return self.view(request)
+
+        wrapped = idempotency.idempotent(view, carries_tokens=True)
+        fake = AsyncOnlyCache()
+
+        async def post():
+            request = AsyncRequestFactory().post(
+                "/social-login/",
+                {"provider": "google"},
+                content_type="application/json",
+                headers={"Idempotency-Key": "key-1"},
+            )
+            return await wrapped(request)
+
+        with mock.patch.object(idempotency, "get_cache", return_value=fake):
+            async_to_sync(post)()
+            retry = async_to_sync(post)()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(list(fake.timeouts.values()), [30 * 60])
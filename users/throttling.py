@@ -0,0 +1,89 @@
+import hashlib
+import math
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket kept in the cache as a single integer.
+
+    A rate of `N/period` is a bucket of N tokens refilled at N per period.
+    The bucket is stored as its "theoretical arrival time" in milliseconds
+    (GCRA), so a check is one atomic `incr`, plus a `decr` when the request
+    is rejected; no per-request history is kept.
+
+    Like `ScopedRateThrottle`, the scope comes from the view's
+    `throttle_scope`; subclasses add a suffix naming what they key on.
+    """
+
+    scope_suffix = None
+
+    def __init__(self):
+        # The rate is looked up in allow_request(), once the view is known.
+        pass
+
+    def allow_request(self, request, view):
+        view_scope = getattr(view, "throttle_scope", None)
+        if not view_scope:
+            return True
+        self.scope = f"{view_scope}_{self.scope_suffix}"
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = int(self.timer() * 1000)
+        self.interval = self.duration * 1000 // self.num_requests
+        burst = self.duration * 1000
+        timeout = self.duration + 1
+
+        if self.cache.add(self.key, self.now + self.interval, timeout):
+            return True
+        try:
+            self.tat = self.cache.incr(self.key, self.interval)
+        except ValueError:
+            # The key expired between add() and incr(): the bucket is full.
+            self.cache.add(self.key, self.now + self.interval, timeout)
+            return True
+
+        if self.tat < self.now + self.interval:
+            # Idle long enough for the bucket to refill completely.
+            self.cache.set(self.key, self.now + self.interval, timeout)
+            return True
+        if self.tat - self.now > burst:
+            self.cache.decr(self.key, self.interval)
+            self.cache.touch(self.key, timeout)
+            self.retry_after = (self.tat - burst - self.now) / 1000
+            return False
+        return True
+
+    def wait(self):
+        return math.ceil(self.retry_after)
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope_suffix = "ip"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    """Keys on the `email` field of the request body, before it is validated."""
+
+    scope_suffix = "email"
+
+    def get_cache_key(self, request, view):
+        try:
+            email = request.data.get("email")
+        except AttributeError:
+            return None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        ident = hashlib.sha256(email.strip().lower().encode()).hexdigest()[:32]
+        return self.cache_format % {"scope": self.scope, "ident": ident}
@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .activity import activity_tracker
+from .metrics import timed
+
+
+@timed("jwt_sign")
+def get_tokens_for_user(user):
+    """Issue a refresh/access pair carrying the claims ClaimsJWTAuthentication needs.
+
+    A new pair is a login, so it is recorded as the user's `last_login`.
+    """
+    activity_tracker.record_login(user)
+    refresh = RefreshToken.for_user(user)
+    refresh["email"] = user.email
+    refresh["role"] = user.role
+    refresh["is_staff"] = user.is_staff
+    refresh["ver"] = user.token_version
+    return {
+        "refresh": str(refresh),
+        "access": str(refresh.access_token),
+    }
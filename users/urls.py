@@ -1,17 +1,66 @@
+from django.conf import settings
 from django.urls import path
 
+from .concurrency import limit_concurrency
+from .idempotency import idempotent
 from .views import (
+    AsyncSocialLoginView,
+    AsyncSocialSignupView,
+    AsyncUserLoginView,
+    AsyncUserSignupView,
+    UserListView,
     UserSignupView,
+    BatchSignupView,
     UserLoginView,
     PasswordResetRequestView,
     PasswordChangeView,
     SocialSignupView,
     SocialLoginView,
+    BulkUserImportView,
+    TokenRotateView,
+    LogoutView,
+    UserStatsView,
+    UserExportView,
 )
 
+# ASGI deployments can serve the auth endpoints with native async views.
+if getattr(settings, "ASYNC_AUTH_VIEWS", False):
+    signup_view = AsyncUserSignupView.as_view()
+    login_view = AsyncUserLoginView.as_view()
+    social_signup_view = AsyncSocialSignupView.as_view()
+    social_login_view = AsyncSocialLoginView.as_view()
+else:
+    signup_view = UserSignupView.as_view()
+    login_view = UserLoginView.as_view()
+    social_signup_view = SocialSignupView.as_view()
+    social_login_view = SocialLoginView.as_view()
+
+# Login (password hashing) and the social views (provider calls) are capped
+# per URL name so a pile-up of them sheds load with a fast 503 instead of
+# stalling every worker; CONCURRENCY_LIMITS in the settings overrides these.
+login_view = limit_concurrency("user-login", login_view, initial_limit=4, max_queue=8)
+social_signup_view = limit_concurrency(
+    "social-signup", social_signup_view, initial_limit=10, max_limit=50
+)
+social_login_view = limit_concurrency(
+    "social-login", social_login_view, initial_limit=10, max_limit=50
+)
+
+# Clients retry these on flaky networks; an Idempotency-Key makes a retry
+# replay the first response instead of creating or linking the account again.
+# Social login answers with a token pair, which is replayed only while its
+# access token is still valid.
+signup_view = idempotent(signup_view)
+social_signup_view = idempotent(social_signup_view)
+social_login_view = idempotent(social_login_view, carries_tokens=True)
+
 urlpatterns = [
-    path("users/signup/", UserSignupView.as_view(), name="user-signup"),
-    path("users/login/", UserLoginView.as_view(), name="user-login"),
+    path("users/", UserListView.as_view(), name="user-list"),
+    path("users/signup/", signup_view, name="user-signup"),
+    path("users/signup/batch/", BatchSignupView.as_view(), name="user-signup-batch"),
+    path("users/login/", login_view, name="user-login"),
+    path("users/token/refresh/", TokenRotateView.as_view(), name="token-refresh"),
+    path("users/logout/", LogoutView.as_view(), name="user-logout"),
     path(
         "users/password-reset/",
         PasswordResetRequestView.as_view(),
@@ -20,6 +69,9 @@ urlpatterns = [
     path(
         "users/password-change/", PasswordChangeView.as_view(), name="password-change"
     ),
-    path("users/social-signup/", SocialSignupView.as_view(), name="social-signup"),
-    path("users/social-login/", SocialLoginView.as_view(), name="social-login"),
+    path("users/social-signup/", social_signup_view, name="social-signup"),
+    path("users/social-login/", social_login_view, name="social-login"),
+    path("users/stats/", UserStatsView.as_view(), name="user-stats"),
+    path("users/bulk-import/", BulkUserImportView.as_view(), name="bulk-import"),
+    path("users/export/", UserExportView.as_view(), name="user-export"),
 ]
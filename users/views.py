@@ -1,19 +1,66 @@
-import requests
-from drf_spectacular.utils import extend_schema
-from rest_framework import generics, status
+import hmac
+import math
+import re
+
+from asgiref.sync import sync_to_async
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from django.views.decorators.gzip import gzip_page
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET
+from rest_framework import exceptions, generics, permissions, serializers, status
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from social_core.exceptions import AuthException
-
-from .models import CustomUser
+from rest_framework_simplejwt.views import TokenRefreshView, TokenViewBase
+
+from . import hashing, metrics
+from .exporter import UserExporter, parse_watermark
+from .importer import UserImporter
+from .models import ROLE_CHOICES, CustomUser, email_prefix_q
+from .pagination import KeysetPagination
+from .permissions import RoleModelPermissions, RolePermission
+from .jwks import verify_google_id_token
+from .providers import ProviderError, ProviderUnavailable, async_provider_client
+from .routers import replica_reads
+from .schema import code_fingerprint, get_schema
+from .social import (
+    aget_or_create_social_user,
+    get_or_create_social_user,
+    get_user_data,
+)
 from .serializers import (
+    BatchSignupSerializer,
+    ImportResultSerializer,
+    UserSerializer,
     UserSignupSerializer,
+    UserStatsSerializer,
     UserLoginSerializer,
     PasswordResetRequestSerializer,
     PasswordChangeSerializer,
     SocialSignupSerializer,
     SocialLoginSerializer,
+    RefreshSerializer,
+    LogoutSerializer,
 )
+from .stats import daily_signups, role_counts
+from .throttling import EmailTokenBucketThrottle, IPTokenBucketThrottle
+from .tokens import get_tokens_for_user
 
 
 class UserSignupView(generics.CreateAPIView):
@@ -30,8 +77,57 @@ class UserSignupView(generics.CreateAPIView):
         )
 
 
+@extend_schema(
+    parameters=[
+        OpenApiParameter("role", enum=[value for value, _ in ROLE_CHOICES]),
+        OpenApiParameter("search", description="Email prefix (case-sensitive)."),
+    ]
+)
+class UserListView(generics.ListAPIView):
+    """List users by role and join date, optionally filtered by email prefix."""
+
+    serializer_class = UserSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = CustomUser.objects.only("id", "email", "role", "date_joined")
+
+        role = self.request.query_params.get("role")
+        if role:
+            if role not in dict(ROLE_CHOICES):
+                raise serializers.ValidationError({"role": "Invalid role."})
+            queryset = queryset.filter(role=role)
+
+        search = self.request.query_params.get("search")
+        if search:
+            queryset = queryset.filter(email_prefix_q(search))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
+
+
+class BatchSignupView(generics.GenericAPIView):
+    """Sign up to 100 users in one request and one transaction."""
+
+    serializer_class = BatchSignupSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response(
+            {"created": created, "results": results}, status=status.HTTP_200_OK
+        )
+
+
 class UserLoginView(APIView):
     serializer_class = UserLoginSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = "login"
 
     @extend_schema(request=UserLoginSerializer)
     def post(self, request, *args, **kwargs):
@@ -47,8 +143,22 @@ class UserLoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TokenRotateView(TokenRefreshView):
+    serializer_class = RefreshSerializer
+
+
+class LogoutView(TokenViewBase):
+    serializer_class = LogoutSerializer
+
+    def post(self, request, *args, **kwargs):
+        super().post(request, *args, **kwargs)
+        return Response({"detail": "Logged out."}, status=status.HTTP_200_OK)
+
+
 class PasswordResetRequestView(generics.CreateAPIView):
     serializer_class = PasswordResetRequestSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = "password_reset"
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -79,11 +189,11 @@ class SocialSignupView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        provider = serializer.validated_data["provider"]
-        access_token = serializer.validated_data["access_token"]
+        credentials = dict(serializer.validated_data)
+        provider = credentials.pop("provider")
 
         try:
-            user = self.authenticate_user(provider, access_token)
+            user = self.authenticate_user(provider, credentials)
             if user:
                 return Response(
                     {"id": user.id, "email": user.email, "role": user.role},
@@ -94,43 +204,27 @@ class SocialSignupView(generics.CreateAPIView):
                     {"error": "Authentication failed."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        except AuthException as e:
+        except ProviderUnavailable as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except ProviderError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    def authenticate_user(self, provider, access_token):
+    def authenticate_user(self, provider, credentials):
         """Authenticate the user using social-auth"""
-        backend = (
-            f"social_core.backends.{provider.lower()}.{provider.capitalize()}OAuth2"
-        )
-
         # Use the logic for getting user details from the provider
-        user_data = self.get_user_data(backend, access_token)
+        user_data = self.get_user_data(provider, credentials)
 
         if user_data:
-            email = user_data.get("email")
             # Check if user already exists or create a new one
-            user, created = CustomUser.objects.get_or_create(email=email)
+            user = get_or_create_social_user(provider, user_data)
             return user
         return None
 
-    def get_user_data(self, backend, access_token):
+    def get_user_data(self, provider, credentials):
         """Get user data from the social provider"""
-        if backend == "social_core.backends.google.GoogleOAuth2":
-            user_info_url = "https://www.googleapis.com/oauth2/v3/userinfo"
-            response = requests.get(
-                user_info_url, headers={"Authorization": f"Bearer {access_token}"}
-            )
-            if response.status_code == 200:
-                return response.json()
-        elif backend == "social_core.backends.facebook.FacebookOAuth2":
-            user_info_url = "https://graph.facebook.com/me?fields=id,name,email"
-            response = requests.get(
-                user_info_url, params={"access_token": access_token}
-            )
-            if response.status_code == 200:
-                return response.json()
-
-        return {}
+        return get_user_data(provider, **credentials) or {}
 
 
 class SocialLoginView(generics.GenericAPIView):
@@ -140,19 +234,18 @@ class SocialLoginView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        provider = serializer.validated_data["provider"]
-        access_token = serializer.validated_data["access_token"]
+        credentials = dict(serializer.validated_data)
+        provider = credentials.pop("provider")
 
         try:
-            user_data = self.get_user_data(provider, access_token)
+            user_data = self.get_user_data(provider, credentials)
             if user_data is None:
                 return Response(
                     {"error": "Invalid token or provider"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            email = user_data.get("email")
-            user, created = CustomUser.objects.get_or_create(email=email)
+            user = get_or_create_social_user(provider, user_data)
 
             token = self.generate_token(user)
 
@@ -161,32 +254,365 @@ class SocialLoginView(generics.GenericAPIView):
                 status=status.HTTP_200_OK,
             )
 
-        except AuthException as e:
+        except ProviderUnavailable as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except ProviderError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    def get_user_data(self, provider, access_token):
-        if provider == "google":
-            user_info_url = "https://www.googleapis.com/oauth2/v3/userinfo"
-            response = requests.get(
-                user_info_url, headers={"Authorization": f"Bearer {access_token}"}
+    def get_user_data(self, provider, credentials):
+        return get_user_data(provider, **credentials)
+
+    def generate_token(self, user):
+        return get_tokens_for_user(user)
+
+
+class AsyncAPIView(View):
+    """Base for the native async auth views served under ASGI.
+
+    DRF 3.15 views are synchronous, so these use DRF's request parsing,
+    serializers and throttles around an async handler and answer with the
+    same payloads and status codes as their DRF counterparts.
+    """
+
+    throttle_classes = []
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        )
+        try:
+            if self.throttle_classes:
+                # Cache-backed; kept off the event loop and the ORM thread.
+                await sync_to_async(self.check_throttles, thread_sensitive=False)(
+                    request
+                )
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def check_throttles(self, request):
+        durations = []
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                durations.append(throttle.wait())
+        if durations:
+            waits = [duration for duration in durations if duration is not None]
+            raise exceptions.Throttled(max(waits, default=None))
+
+    def handle_exception(self, exc):
+        detail = exc.detail
+        if not isinstance(detail, (list, dict)):
+            detail = {"detail": detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        if getattr(exc, "wait", None):
+            response["Retry-After"] = str(math.ceil(exc.wait))
+        return response
+
+
+class AsyncUserSignupView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        serializer = UserSignupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = {
+            **serializer.validated_data,
+            "password": await hashing.amake_password(
+                serializer.validated_data["password"]
+            ),
+        }
+        serializer.instance = await sync_to_async(serializer.insert)(data)
+        return JsonResponse(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncUserLoginView(AsyncAPIView):
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = "login"
+
+    async def post(self, request, *args, **kwargs):
+        serializer = UserLoginSerializer(data=request.data)
+        if not await serializer.ais_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        user = serializer.validated_data["user"]
+        return JsonResponse(
+            {
+                "email": user.email,
+                "role": user.role,
+                "tokens": serializer.get_tokens(user),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class AsyncSocialView(AsyncAPIView):
+    serializer_class = None
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        provider = serializer.validated_data["provider"]
+        try:
+            if "id_token" in serializer.validated_data:
+                # Verifying is local, but may have to fetch Google's keys.
+                user_data = await sync_to_async(
+                    verify_google_id_token, thread_sensitive=False
+                )(serializer.validated_data["id_token"])
+            else:
+                user_data = await async_provider_client.get_user_data(
+                    provider, serializer.validated_data["access_token"]
+                )
+            return await self.respond(provider, user_data)
+        except ProviderUnavailable as e:
+            return JsonResponse(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except ProviderError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncSocialSignupView(AsyncSocialView):
+    serializer_class = SocialSignupSerializer
+
+    async def respond(self, provider, user_data):
+        if not user_data:
+            return JsonResponse(
+                {"error": "Authentication failed."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        user = await aget_or_create_social_user(provider, user_data)
+        return JsonResponse(
+            {"id": user.id, "email": user.email, "role": user.role},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AsyncSocialLoginView(AsyncSocialView):
+    serializer_class = SocialLoginSerializer
+
+    async def respond(self, provider, user_data):
+        if user_data is None:
+            return JsonResponse(
+                {"error": "Invalid token or provider"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        user = await aget_or_create_social_user(provider, user_data)
+        return JsonResponse(
+            {"id": user.id, "email": user.email, "token": get_tokens_for_user(user)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class BulkUserImportView(APIView):
+    """Stream a CSV or NDJSON body of users into the database.
+
+    Open to staff and to roles granted `users.add_customuser`.
+    """
+
+    permission_classes = [permissions.IsAdminUser | RoleModelPermissions]
+    queryset = CustomUser.objects.none()  # for RoleModelPermissions
+    max_reported_errors = 1000
+
+    @extend_schema(
+        request={"text/csv": bytes, "application/x-ndjson": bytes},
+        responses=ImportResultSerializer,
+    )
+    def post(self, request, *args, **kwargs):
+        fmt = request.query_params.get("format")
+        if fmt is None:
+            content_type = request.content_type.split(";")[0].strip()
+            fmt = {
+                "text/csv": "csv",
+                "application/x-ndjson": "ndjson",
+                "application/jsonlines": "ndjson",
+            }.get(content_type)
+        if fmt not in ("csv", "ndjson"):
+            return Response(
+                {"error": "Send text/csv or application/x-ndjson."},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
             )
-        elif provider == "facebook":
-            user_info_url = "https://graph.facebook.com/me?fields=id,name,email"
-            response = requests.get(
-                user_info_url, params={"access_token": access_token}
+        if request.stream is None:
+            return Response(
+                {"error": "Empty request body."}, status=status.HTTP_400_BAD_REQUEST
             )
+
+        errors = []
+
+        def on_error(line_number, email, message):
+            if len(errors) < self.max_reported_errors:
+                errors.append({"line": line_number, "email": email, "error": message})
+
+        importer = UserImporter(on_error=on_error)
+        # Undecodable bytes are replaced, and their rows rejected by the importer.
+        lines = (line.decode("utf-8", errors="replace") for line in request.stream)
+        result = importer.run(lines, fmt)
+        return Response({**result, "error_report": errors}, status=status.HTTP_200_OK)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class UserExportView(APIView):
+    """Stream every user as CSV or NDJSON.
+
+    Open to staff and to roles granted `users.view_customuser`. Pick the
+    format with `?format=` or the Accept header; gzip is applied when the
+    client accepts it. `since` limits the export to users who joined after
+    that moment, and the `X-Export-Watermark` header carries the `since` of
+    the next incremental export.
+    """
+
+    permission_classes = [permissions.IsAdminUser | RolePermission]
+    required_permissions = ["users.view_customuser"]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    accepts_gzip = re.compile(r"\bgzip\b")
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("since", OpenApiTypes.DATETIME),
+            OpenApiParameter("until", OpenApiTypes.DATETIME),
+        ],
+        responses={(200, "text/csv"): bytes, (200, "application/x-ndjson"): bytes},
+    )
+    def get(self, request, *args, **kwargs):
+        bounds = {}
+        for name in ("since", "until"):
+            value = request.query_params.get(name)
+            if value:
+                try:
+                    bounds[name] = parse_watermark(value)
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {name: "Must be an ISO 8601 datetime."}
+                    )
+        gzipped = bool(
+            self.accepts_gzip.search(request.headers.get("Accept-Encoding", ""))
+        )
+        exporter = UserExporter(
+            request.accepted_renderer.format, compress=gzipped, **bounds
+        )
+
+        # Each handler buffers an iterator of the other kind in full.
+        if isinstance(request._request, ASGIRequest):
+            content = aiter(exporter)
         else:
-            return None
+            content = iter(exporter)
+        response = StreamingHttpResponse(
+            content,
+            content_type=exporter.content_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="users.{exporter.fmt}"',
+                "X-Export-Watermark": exporter.until.isoformat(),
+                "Vary": "Accept, Accept-Encoding",
+            },
+        )
+        if gzipped:
+            response["Content-Encoding"] = "gzip"
+        return response
 
-        if response.status_code == 200:
-            return response.json()
-        return None
+    def finalize_response(self, request, response, *args, **kwargs):
+        if isinstance(response, Response):
+            # Errors are JSON, whichever format was asked for.
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
 
-    def generate_token(self, user):
-        from rest_framework_simplejwt.tokens import RefreshToken
 
-        refresh = RefreshToken.for_user(user)
-        return {
-            "refresh": str(refresh),
-            "access": str(refresh.access_token),
-        }
+class UserStatsView(APIView):
+    """Active users per role and signups per day, read from `StatCounter`.
+
+    Open to staff and to roles granted `users.view_statcounter`.
+    """
+
+    permission_classes = [permissions.IsAdminUser | RolePermission]
+    required_permissions = ["users.view_statcounter"]
+    max_days = 366
+
+    @extend_schema(
+        parameters=[OpenApiParameter("days", int, default=30)],
+        responses=UserStatsSerializer,
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            raise serializers.ValidationError({"days": "Must be an integer."})
+        days = max(1, min(days, self.max_days))
+        with replica_reads():
+            data = {"roles": role_counts(), "signups": daily_signups(days)}
+        return Response(data, status=status.HTTP_200_OK)
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint; needs `Bearer <METRICS["TOKEN"]>` if one is set."""
+    token = metrics.get_setting("TOKEN")
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+class SchemaView(SpectacularAPIView):
+    """Serves the prebuilt schema from `users.schema` instead of regenerating it.
+
+    Responses carry an ETag, answer `If-None-Match` with 304 and come
+    pre-compressed when the client accepts gzip.
+    """
+
+    accepts_gzip = re.compile(r"\bgzip\b")
+
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        schema = get_schema()
+        renderer = request.accepted_renderer
+        gzipped = bool(
+            self.accepts_gzip.search(request.headers.get("Accept-Encoding", ""))
+        )
+        etag = schema.etag(renderer.format, gzipped)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in if_none_match or etag in (
+            tag.removeprefix("W/") for tag in if_none_match
+        ):
+            response = HttpResponseNotModified(headers=headers)
+        else:
+            response = HttpResponse(
+                schema.body(renderer.format, gzipped),
+                content_type=f"{renderer.media_type}; charset=utf-8",
+                headers=headers,
+            )
+            if gzipped:
+                response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept, Accept-Encoding"
+        return response
+
+
+def docs_etag(request, *args, **kwargs):
+    # The page only references the schema URL, so it changes with the code.
+    return f'"docs-{code_fingerprint()[:32]}"'
+
+
+@method_decorator(gzip_page, name="dispatch")
+class SwaggerView(SpectacularSwaggerView):
+    @extend_schema(exclude=True)
+    @method_decorator(condition(etag_func=docs_etag))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
@@ -0,0 +1,47 @@
+import logging
+import time
+
+from django.contrib.auth.hashers import get_hasher, get_hashers
+from django.urls import get_resolver
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .backends import dummy_password_hash
+from .schema import get_schema
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Do the one-off work of a worker's first requests at boot instead.
+
+    Imports every view and builds the URL resolver's lookup tables,
+    instantiates the password hashers and makes the dummy hash unknown
+    emails are checked against, signs and verifies a throwaway JWT
+    (loading the signing key and algorithm), and loads the OpenAPI schema.
+    Called from wsgi.py and asgi.py; returns the time taken per step. A
+    step that fails is logged and left out, so its work is done on first
+    use instead and the worker still boots.
+    """
+    steps = {
+        "urls": lambda: get_resolver().reverse_dict,
+        "hashers": lambda: (get_hashers(), get_hasher("default")),
+        "dummy_hash": dummy_password_hash,
+        "jwt": lambda: AccessToken(str(AccessToken())),
+        "schema": get_schema,
+    }
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %r failed; it will run on first use", name)
+            continue
+        timings[name] = time.perf_counter() - start
+    logger.debug(
+        "Warm-up: %s",
+        ", ".join(
+            f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items()
+        ),
+    )
+    return timings